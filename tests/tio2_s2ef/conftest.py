@@ -0,0 +1,36 @@
+"""
+Fixtures for the TiO2 S2EF preprocessing scripts
+"""
+
+import importlib.util
+import sys
+from pathlib import Path
+
+import pytest
+
+SRC_DIR = Path(__file__).resolve().parents[2] / "tio2_s2ef" / "src"
+
+
+@pytest.fixture(scope="session")
+def load_script():
+    """
+    Import a preprocessing script by its path relative to tio2_s2ef/src
+
+    The step scripts start with a digit, so they cannot be imported by name.
+    Each one is registered in sys.modules so its classes and functions can
+    be pickled.
+    """
+    sys.path.insert(0, str(SRC_DIR))
+
+    def load(relative_path):
+        path = SRC_DIR / relative_path
+        name = f"{path.parent.name}_{path.stem.lstrip('0123456789_')}"
+        if name in sys.modules:
+            return sys.modules[name]
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+        return module
+
+    return load
@@ -0,0 +1,138 @@
+"""
+Tests for the shared download helpers (download_utils.py)
+"""
+
+import http.server
+import os
+import threading
+
+import pytest
+
+SIZE = 100_003
+
+
+@pytest.fixture(scope="module")
+def download_utils(load_script):
+    return load_script("download_utils.py")
+
+
+@pytest.fixture
+def serve():
+    """Start a local HTTP server for a payload, returns (url, requests)"""
+    servers = []
+
+    def start(payload, accept_ranges=True, allow_head=True):
+        requests = []
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def send_payload_headers(self, status, length):
+                self.send_response(status)
+                if accept_ranges:
+                    self.send_header("Accept-Ranges", "bytes")
+                self.send_header("Content-Length", str(length))
+                self.end_headers()
+
+            def do_HEAD(self):
+                requests.append(("HEAD", None))
+                if not allow_head:
+                    self.send_error(405)
+                    return
+                self.send_payload_headers(200, len(payload))
+
+            def do_GET(self):
+                byte_range = self.headers.get("Range")
+                requests.append(("GET", byte_range))
+                if byte_range is None or not accept_ranges:
+                    self.send_payload_headers(200, len(payload))
+                    self.wfile.write(payload)
+                    return
+                start, end = byte_range.removeprefix("bytes=").split("-")
+                body = payload[int(start) : int(end) + 1]
+                self.send_payload_headers(206, len(body))
+                self.wfile.write(body)
+
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_port}/file.bin", requests
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def test_download_ranges(download_utils, serve, tmp_path):
+    payload = os.urandom(SIZE)
+    url, requests = serve(payload)
+    output_path = tmp_path / "file.bin"
+
+    download_utils.download_file(url, output_path)
+
+    assert output_path.read_bytes() == payload
+    assert not download_utils.parts_path(output_path).exists()
+    ranges = [byte_range for method, byte_range in requests if byte_range]
+    assert len(ranges) == download_utils.NUM_CONNECTIONS
+
+
+def test_download_resume(download_utils, serve, tmp_path):
+    payload = os.urandom(SIZE)
+    url, requests = serve(payload)
+    output_path = tmp_path / "file.bin"
+
+    # Leave an interrupted download behind: the first half of every range
+    # is on disk and recorded in the progress file
+    step = -(-SIZE // download_utils.NUM_CONNECTIONS)
+    parts = []
+    partial = bytearray(SIZE)
+    for start in range(0, SIZE, step):
+        end = min(start + step, SIZE) - 1
+        done = (end - start + 1) // 2
+        partial[start : start + done] = payload[start : start + done]
+        parts.append([start, end, done])
+    output_path.write_bytes(partial)
+    download_utils.save_parts(
+        download_utils.parts_path(output_path), url, SIZE, parts
+    )
+
+    download_utils.download_file(url, output_path)
+
+    assert output_path.read_bytes() == payload
+    assert not download_utils.parts_path(output_path).exists()
+    # Only the missing second halves are requested again
+    expected = {f"bytes={start + done}-{end}" for start, end, done in parts}
+    assert {byte_range for _, byte_range in requests if byte_range} == expected
+
+
+@pytest.mark.parametrize(
+    "accept_ranges, allow_head", [(False, True), (True, False)]
+)
+def test_download_fallback(
+    download_utils, serve, tmp_path, accept_ranges, allow_head
+):
+    # Without range support, or when HEAD is rejected, the file is fetched
+    # as a single stream
+    payload = os.urandom(SIZE)
+    url, requests = serve(
+        payload, accept_ranges=accept_ranges, allow_head=allow_head
+    )
+    output_path = tmp_path / "file.bin"
+
+    download_utils.download_file(url, output_path)
+
+    assert output_path.read_bytes() == payload
+    assert [request for request in requests if request[0] == "GET"] == [
+        ("GET", None)
+    ]
+
+
+def test_download_empty(download_utils, serve, tmp_path):
+    url, _ = serve(b"")
+    output_path = tmp_path / "file.bin"
+
+    download_utils.download_file(url, output_path)
+
+    assert output_path.read_bytes() == b""
@@ -0,0 +1,128 @@
+"""
+Tests for OC20 step 5 (05_compute_statistics.py)
+"""
+
+import pickle
+
+import lmdb
+import numpy as np
+import pytest
+import torch
+from torch_geometric.data import Data
+
+
+@pytest.fixture(scope="module")
+def compute_statistics(load_script):
+    return load_script("oc20_preprocessing/05_compute_statistics.py")
+
+
+def make_data(num_atoms, seed):
+    rng = np.random.default_rng(seed)
+    return Data(
+        pos=torch.tensor(rng.normal(size=(num_atoms, 3)), dtype=torch.float),
+        cell=torch.eye(3).view(1, 3, 3),
+        atomic_numbers=torch.full((num_atoms,), 22.0),
+        natoms=num_atoms,
+        tags=torch.zeros(num_atoms, dtype=torch.long),
+        fixed=torch.zeros(num_atoms),
+        sid=seed,
+        fid=0,
+        y=float(rng.normal()),
+        force=torch.tensor(
+            rng.normal(size=(num_atoms, 3)), dtype=torch.float
+        ),
+    )
+
+
+def write_lmdb(path, records):
+    env = lmdb.open(str(path), subdir=False, map_size=1 << 26)
+    with env.begin(write=True) as txn:
+        for i, data in enumerate(records):
+            txn.put(f"{i}".encode("ascii"), pickle.dumps(data, protocol=-1))
+        txn.put(b"length", pickle.dumps(len(records), protocol=-1))
+    env.close()
+
+
+def test_running_stats(compute_statistics):
+    rng = np.random.default_rng(0)
+    batches = [
+        rng.normal(loc=3.0, scale=2.0, size=size).astype(np.float32)
+        for size in (1, 0, 17, 1000, 3, 4096)
+    ]
+    stats = compute_statistics.RunningStats()
+    for batch in batches:
+        stats.update(batch)
+
+    values = np.concatenate(batches)
+    assert stats.count == values.size
+    np.testing.assert_allclose(stats.mean, np.mean(values, dtype=np.float64))
+    np.testing.assert_allclose(stats.std, np.std(values, dtype=np.float64))
+    assert stats.min == float(values.min())
+    assert stats.max == float(values.max())
+
+
+def test_running_stats_empty(compute_statistics):
+    stats = compute_statistics.RunningStats()
+    stats.update(np.empty(0, dtype=np.float32))
+    assert stats.count == 0
+    assert stats.std == 0.0
+    assert stats.min is None and stats.max is None
+
+
+@pytest.mark.parametrize("tensor_energy", [False, True])
+def test_load_targets(compute_statistics, tensor_energy):
+    data = make_data(5, seed=1)
+    if tensor_energy:
+        data.y = torch.tensor([data.y])
+    value = pickle.dumps(data, protocol=-1)
+
+    energy, force = compute_statistics.load_targets(value)
+    expected = pickle.loads(value)
+    assert energy == float(expected.y)
+    assert force.dtype == expected.force.dtype
+    assert torch.equal(force, expected.force)
+
+
+def test_load_targets_fallback(compute_statistics, monkeypatch):
+    # Without torch's private rebuild helpers records are unpickled fully
+    monkeypatch.setattr(compute_statistics, "_rebuild_tensor_v2", None)
+    data = make_data(4, seed=2)
+
+    energy, force = compute_statistics.load_targets(pickle.dumps(data))
+    assert energy == data.y
+    assert torch.equal(force, data.force)
+
+
+def test_compute_statistics(compute_statistics, tmp_path):
+    shards = [
+        [make_data(3, seed=10), make_data(6, seed=11)],
+        [make_data(2, seed=12)],
+    ]
+    paths = []
+    for i, records in enumerate(shards):
+        paths.append(tmp_path / f"data.{i:04d}.lmdb")
+        write_lmdb(paths[-1], records)
+
+    stats = compute_statistics.compute_statistics(paths)
+
+    records = [data for records in shards for data in records]
+    energies = np.array([data.y for data in records])
+    forces = np.concatenate([data.force.numpy().ravel() for data in records])
+    assert stats["num_frames"] == len(records)
+    assert stats["num_force_components"] == forces.size
+    np.testing.assert_allclose(stats["target_mean"], energies.mean())
+    np.testing.assert_allclose(stats["target_std"], energies.std())
+    np.testing.assert_allclose(
+        stats["grad_target_mean"], forces.mean(dtype=np.float64), rtol=1e-6
+    )
+    np.testing.assert_allclose(
+        stats["grad_target_std"], forces.std(dtype=np.float64), rtol=1e-6
+    )
+    assert stats["force_min"] == float(forces.min())
+    assert stats["force_max"] == float(forces.max())
+
+
+def test_compute_statistics_empty(compute_statistics, tmp_path):
+    path = tmp_path / "data.0000.lmdb"
+    write_lmdb(path, [])
+    assert compute_statistics.compute_statistics([path]) is None
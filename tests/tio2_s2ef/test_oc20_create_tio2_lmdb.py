@@ -0,0 +1,100 @@
+"""
+Tests for the extxyz reader of OC20 step 4 (04_create_tio2_lmdb.py)
+"""
+
+import io
+
+import ase.io
+import pytest
+import torch
+
+from ocpmodels.preprocessing import AtomsToGraphs
+
+# Converter settings used by step 4
+A2G_KWARGS = dict(
+    max_neigh=50,
+    radius=6,
+    r_energy=True,
+    r_forces=True,
+    r_fixed=True,
+    r_distances=False,
+    r_edges=False,
+)
+
+PROPERTIES = (
+    "Properties=species:S:1:pos:R:3:move_mask:L:1:tags:I:1:forces:R:3"
+)
+
+# Three S2EF frames: some atoms fixed, no atoms fixed and all atoms fixed
+EXTXYZ = f"""3
+Lattice="8.0 0.0 0.0 0.0 8.5 0.0 0.1 0.0 9.0" {PROPERTIES} energy=-181.38493 pbc="T T T"
+Ti       2.15829371       0.32778819       0.13222108  F        0       0.26445563      -0.31392281       1.45802068
+O        6.50616191       7.30204462       4.85308621  T        1      -1.96025832e-03   1.80163487       0.00000000
+O        1.00000000      -2.50000000      11.25000000  T        2       0.00000000       0.00000000      -0.12345678
+2
+Lattice="8.0 0.0 0.0 0.0 8.5 0.0 0.1 0.0 9.0" {PROPERTIES} energy=0.7813114007004275 pbc="T T T"
+Ti       2.25829371       0.42778819       0.23222108  T        1       0.16445563      -0.21392281       1.35802068
+O        6.60616191       7.40204462       4.95308621  T        2      -1.86025832       1.70163487       1.21510376
+4
+Lattice="8.0 0.0 0.0 0.0 8.5 0.0 0.1 0.0 9.0" {PROPERTIES} energy=-3.5e-2 pbc="T T F"
+Pt       0.00000000       0.00000000       0.00000000  F        0       0.00000000       0.00000000       0.00000000
+Pt       2.80000000       0.00000000       0.00000000  F        0       0.00000000       0.00000000       0.00000000
+Ti       1.40000000       1.40000000       2.10000000  F        1       0.01000000      -0.02000000       0.03000000
+O        1.40000000       1.40000000       4.10000000  F        2      -0.01000000       0.02000000      -0.03000000
+"""
+
+
+@pytest.fixture(scope="module")
+def create_lmdb(load_script):
+    return load_script("oc20_preprocessing/04_create_tio2_lmdb.py")
+
+
+def convert_with_ase(keep=None):
+    """Frames the way the original step built them, via ase.io.read"""
+    frames = ase.io.read(io.StringIO(EXTXYZ), ":", format="extxyz")
+    if keep is not None:
+        frames = [frame for i, frame in enumerate(frames) if i in keep]
+    a2g = AtomsToGraphs(**A2G_KWARGS)
+    data_objects = []
+    for frame in frames:
+        data = a2g.convert(frame)
+        data.tags = torch.LongTensor(frame.get_tags())
+        data_objects.append(data)
+    return data_objects
+
+
+def assert_same_data(data, expected):
+    assert sorted(data.keys()) == sorted(expected.keys())
+    for key in expected.keys():
+        value, expected_value = data[key], expected[key]
+        if isinstance(expected_value, torch.Tensor):
+            assert value.dtype == expected_value.dtype, key
+            assert value.shape == expected_value.shape, key
+            assert torch.equal(value, expected_value), key
+        elif isinstance(expected_value, float):
+            # ASE gives the energy as np.float64, a float subclass that
+            # collates the same way, the reader stores a plain float
+            assert isinstance(value, float), key
+            assert value == expected_value, key
+        else:
+            assert type(value) is type(expected_value), key
+            assert value == expected_value, key
+
+
+@pytest.mark.parametrize("keep", [None, {0, 2}, {1}])
+def test_read_extxyz_matches_ase(create_lmdb, keep):
+    frames = create_lmdb.read_extxyz(io.StringIO(EXTXYZ), keep)
+    a2g = create_lmdb.FrameToGraphs(**A2G_KWARGS)
+    data_objects = [a2g.convert(frame) for frame in frames]
+
+    expected = convert_with_ase(keep)
+    assert len(data_objects) == len(expected)
+    for data, expected_data in zip(data_objects, expected):
+        assert_same_data(data, expected_data)
+
+
+def test_read_extxyz_fixed_atoms(create_lmdb):
+    frames = create_lmdb.read_extxyz(io.StringIO(EXTXYZ))
+    a2g = create_lmdb.FrameToGraphs(**A2G_KWARGS)
+    fixed = [a2g.convert(frame).fixed.tolist() for frame in frames]
+    assert fixed == [[1, 0, 0], [0, 0], [1, 1, 1, 1]]
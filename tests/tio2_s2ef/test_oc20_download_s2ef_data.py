@@ -0,0 +1,97 @@
+"""
+Tests for tar extraction in OC20 step 3 (03_download_s2ef_data.py)
+"""
+
+import io
+import lzma
+import tarfile
+
+import pytest
+
+
+@pytest.fixture(scope="module")
+def download_s2ef(load_script):
+    return load_script("oc20_preprocessing/03_download_s2ef_data.py")
+
+
+def make_tar(path, files):
+    with tarfile.open(path, "w") as tar:
+        for name, data in files:
+            info = tarfile.TarInfo(name)
+            if data is None:
+                info.type = tarfile.DIRTYPE
+                tar.addfile(info)
+            else:
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+    return path
+
+
+def open_stream(path):
+    # Streaming mode, as used for archives extracted while downloading
+    return tarfile.open(path, mode="r|")
+
+
+def test_extract_members(download_s2ef, tmp_path):
+    tar_path = make_tar(
+        tmp_path / "s2ef.tar",
+        [
+            ("s2ef/", None),
+            ("s2ef/README", b"readme"),
+            ("s2ef/0.extxyz.xz", lzma.compress(b"frames")),
+            ("s2ef/0.txt.xz", lzma.compress(b"ids")),
+        ],
+    )
+    raw_dir = tmp_path / "raw"
+    uncompressed_dir = tmp_path / "uncompressed"
+
+    with open_stream(tar_path) as tar:
+        download_s2ef.extract_members(
+            tar, raw_dir, uncompressed_dir, progress=False
+        )
+
+    assert (raw_dir / "s2ef" / "README").read_bytes() == b"readme"
+    assert (uncompressed_dir / "0.extxyz").read_bytes() == b"frames"
+    assert (uncompressed_dir / "0.txt").read_bytes() == b"ids"
+    assert not (raw_dir / "s2ef" / "0.txt.xz").exists()
+
+
+@pytest.mark.parametrize(
+    "name", ["../evil", "s2ef/../../evil", "{tmp}/evil"]
+)
+def test_extract_outside_rejected(download_s2ef, tmp_path, name):
+    name = name.format(tmp=tmp_path)
+    tar_path = make_tar(tmp_path / "s2ef.tar", [(name, b"evil")])
+    raw_dir = tmp_path / "a" / "raw"
+
+    with open_stream(tar_path) as tar:
+        with pytest.raises(tarfile.TarError):
+            download_s2ef.extract_members(tar, raw_dir, progress=False)
+    with pytest.raises(tarfile.TarError):
+        download_s2ef.extract_tar(tar_path, raw_dir, num_processes=1)
+
+    assert not any(path.name == "evil" for path in tmp_path.rglob("*"))
+
+
+def test_extract_members_stops_on_failed_write(
+    download_s2ef, tmp_path, monkeypatch
+):
+    num_files = 1000
+    tar_path = make_tar(
+        tmp_path / "s2ef.tar",
+        [(f"s2ef/{i}.txt", b"x") for i in range(num_files)],
+    )
+    writes = []
+
+    def write_file(output_path, data, decompress=False):
+        writes.append(output_path)
+        raise OSError("disk full")
+
+    monkeypatch.setattr(download_s2ef, "write_file", write_file)
+
+    with open_stream(tar_path) as tar:
+        with pytest.raises(OSError, match="disk full"):
+            download_s2ef.extract_members(
+                tar, tmp_path / "raw", num_workers=1, progress=False
+            )
+    assert len(writes) < num_files // 10
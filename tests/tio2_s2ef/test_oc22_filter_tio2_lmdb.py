@@ -0,0 +1,101 @@
+"""
+Tests for reading system IDs in OC22 step 4 (04_filter_tio2_lmdb.py)
+"""
+
+import pickle
+
+import numpy as np
+import pytest
+import torch
+from torch_geometric.data import Data
+
+PROTOCOLS = [2, 4, pickle.HIGHEST_PROTOCOL]
+
+
+@pytest.fixture(scope="module")
+def filter_lmdb(load_script):
+    return load_script("oc22_preprocessing/04_filter_tio2_lmdb.py")
+
+
+def make_record(sid, protocol):
+    data = Data(
+        pos=torch.zeros(2, 3),
+        sid=sid,
+        fid=7,
+        y=-1.5,
+    )
+    return pickle.dumps(data, protocol=protocol)
+
+
+@pytest.mark.parametrize("protocol", PROTOCOLS)
+@pytest.mark.parametrize("sid", [12345, 3, -4, "12345", "random1234"])
+def test_scan_sid_literal(filter_lmdb, sid, protocol):
+    assert filter_lmdb.scan_sid(make_record(sid, protocol)) == sid
+
+
+@pytest.mark.parametrize("protocol", PROTOCOLS)
+@pytest.mark.parametrize(
+    "sid", [np.int64(12345), torch.tensor(12345), (12345,)]
+)
+def test_scan_sid_object(filter_lmdb, sid, protocol):
+    # The first literal after the key belongs to an object here, e.g. the
+    # module name of a NumPy scalar, so the caller has to unpickle
+    assert filter_lmdb.scan_sid(make_record(sid, protocol)) is None
+
+
+@pytest.mark.parametrize(
+    "line, sid",
+    [
+        ("12345", 12345),
+        ("12345", "12345"),
+        ("-4", -4),
+        ("007", "007"),
+        ("random1234", "random1234"),
+    ],
+)
+def test_parse_system_id_match(filter_lmdb, line, sid):
+    # IDs match exactly when their string forms do
+    parse = filter_lmdb.parse_system_id
+    assert parse(line) == parse(sid)
+
+
+@pytest.mark.parametrize("line, sid", [("007", 7), ("12345", 1234)])
+def test_parse_system_id_mismatch(filter_lmdb, line, sid):
+    parse = filter_lmdb.parse_system_id
+    assert parse(line) != parse(sid)
+
+
+@pytest.mark.parametrize("protocol", [4, pickle.HIGHEST_PROTOCOL])
+@pytest.mark.parametrize("sid", [12345, 3, -4, 2**40, "12345", "random1234"])
+def test_peek_sid_literal(filter_lmdb, sid, protocol):
+    assert filter_lmdb.peek_sid(make_record(sid, protocol)) == sid
+
+
+@pytest.mark.parametrize("protocol", [4, pickle.HIGHEST_PROTOCOL])
+@pytest.mark.parametrize(
+    "sid", [np.int64(12345), torch.tensor(12345), (12345,)]
+)
+def test_peek_sid_object(filter_lmdb, sid, protocol):
+    assert filter_lmdb.peek_sid(make_record(sid, protocol)) is None
+
+
+@pytest.mark.parametrize("protocol", PROTOCOLS)
+@pytest.mark.parametrize(
+    "sid",
+    [
+        12345,
+        -4,
+        "12345",
+        "random1234",
+        np.int64(12345),
+        torch.tensor(12345),
+        (12345,),
+    ],
+)
+def test_read_sid(filter_lmdb, sid, protocol):
+    # Same ID as a full unpickle, compared by string form like the
+    # original step did
+    value = make_record(sid, protocol)
+    expected = filter_lmdb.parse_system_id(str(pickle.loads(value).sid))
+    assert filter_lmdb.read_sid(value) == expected
+    assert filter_lmdb.read_sid(memoryview(value)) == expected
@@ -0,0 +1,170 @@
+"""
+Download helpers shared by the OC20 and OC22 preprocessing steps
+"""
+
+import json
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from tqdm import tqdm
+
+# Number of parallel HTTP range requests per download
+NUM_CONNECTIONS = 8
+
+# Bytes read from a response per write
+CHUNK_SIZE = 1024 * 1024
+
+# Chunks written by a connection between progress checkpoints
+CHECKPOINT_CHUNKS = 64
+
+
+class DownloadProgressBar(tqdm):
+    """Progress bar for downloads"""
+    def update_to(self, b=1, bsize=1, tsize=None):
+        if tsize is not None:
+            self.total = tsize
+        self.update(b * bsize - self.n)
+
+
+class RangeNotSupported(Exception):
+    """Raised when the server answers a range request with the full file"""
+
+
+def get_ranged_size(url):
+    """Return the file size if the server accepts byte ranges, else None"""
+    request = urllib.request.Request(url, method='HEAD')
+    try:
+        with urllib.request.urlopen(request) as response:
+            if response.headers.get('Accept-Ranges') != 'bytes':
+                return None
+            size = response.headers.get('Content-Length')
+    except urllib.error.HTTPError:
+        # Some servers and proxies reject HEAD (403/405), a plain GET may
+        # still work
+        return None
+    return int(size) if size else None
+
+
+def parts_path(output_path):
+    """Path of the sidecar file tracking a download's range progress"""
+    return output_path.with_name(output_path.name + '.part.json')
+
+
+def load_parts(state_path, output_path, url, size):
+    """Load per-range progress of an interrupted download, if it matches"""
+    if not state_path.exists() or not output_path.exists():
+        return None
+    with open(state_path, 'r') as f:
+        state = json.load(f)
+    if state['url'] != url or state['size'] != size:
+        return None
+    return state['parts']
+
+
+def save_parts(state_path, url, size, parts):
+    """Persist per-range progress so a restart resumes where it stopped"""
+    tmp_path = state_path.with_name(state_path.name + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump({'url': url, 'size': size, 'parts': parts}, f)
+    tmp_path.replace(state_path)
+
+
+def download_range(url, output_path, part, checkpoint, lock, pbar, stop):
+    """Download one [start, end] byte range, part[2] counts bytes written"""
+    start, end, done = part
+    if start + done > end or stop.is_set():
+        return
+    
+    request = urllib.request.Request(
+        url, headers={'Range': f"bytes={start + done}-{end}"}
+    )
+    with urllib.request.urlopen(request) as response:
+        if response.status != 206:
+            raise RangeNotSupported(url)
+        with open(output_path, 'r+b') as f:
+            f.seek(start + done)
+            chunks = 0
+            while chunk := response.read(CHUNK_SIZE):
+                # Another range failed or the download was interrupted
+                if stop.is_set():
+                    return
+                f.write(chunk)
+                chunks += 1
+                with lock:
+                    part[2] += len(chunk)
+                    pbar.update(len(chunk))
+                    if chunks % CHECKPOINT_CHUNKS == 0:
+                        f.flush()
+                        checkpoint()
+
+
+def download_ranges(url, output_path, size, num_connections=NUM_CONNECTIONS):
+    """Download a file as parallel byte ranges written at their offsets"""
+    state_path = parts_path(output_path)
+    
+    parts = load_parts(state_path, output_path, url, size)
+    if parts is None:
+        # Preallocate the file and split it into equal ranges
+        with open(output_path, 'wb') as f:
+            f.truncate(size)
+        step = -(-size // num_connections)
+        parts = [
+            [start, min(start + step, size) - 1, 0]
+            for start in range(0, size, step)
+        ]
+    else:
+        print("Resuming interrupted download")
+    
+    lock = threading.Lock()
+    checkpoint = lambda: save_parts(state_path, url, size, parts)
+    stop = threading.Event()
+    
+    with tqdm(
+        total=size,
+        initial=sum(part[2] for part in parts),
+        unit='B',
+        unit_scale=True,
+        desc="Downloading",
+    ) as pbar:
+        pool = ThreadPoolExecutor(max_workers=len(parts))
+        try:
+            futures = [
+                pool.submit(download_range, url, output_path, part, checkpoint, lock, pbar, stop)
+                for part in parts
+            ]
+            for future in futures:
+                future.result()
+        finally:
+            # On an error or Ctrl-C, stop the remaining ranges after their
+            # current chunk instead of waiting for them to finish
+            stop.set()
+            pool.shutdown(wait=True, cancel_futures=True)
+            with lock:
+                checkpoint()
+    
+    state_path.unlink()
+
+
+def download_file(url, output_path):
+    """Download file with progress bar, using parallel range requests when possible"""
+    print(f"Downloading from: {url}")
+    print(f"Saving to: {output_path}")
+    
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    
+    size = get_ranged_size(url)
+    try:
+        # Empty files have nothing to split into ranges
+        if not size:
+            raise RangeNotSupported(url)
+        download_ranges(url, output_path, size)
+    except RangeNotSupported:
+        # Fall back to a single stream, dropping any stale range progress
+        parts_path(output_path).unlink(missing_ok=True)
+        with DownloadProgressBar(unit='B', unit_scale=True, miniters=1, desc="Downloading") as t:
+            urllib.request.urlretrieve(url, output_path, reporthook=t.update_to)
+    
+    size_gb = output_path.stat().st_size / (1024**3)
+    print(f"Downloaded: {size_gb:.2f} GB")
\ No newline at end of file
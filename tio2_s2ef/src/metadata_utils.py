@@ -0,0 +1,76 @@
+"""
+Metadata I/O helpers shared by the OC20 and OC22 preprocessing steps
+"""
+
+import json
+import mmap
+import pickle
+from itertools import islice
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Number of items processed between progress updates
+PROGRESS_INTERVAL = 1 << 16
+
+# Write buffer for JSON outputs
+JSON_BUFFER_SIZE = 1 << 20
+
+
+def load_pickle(path):
+    """
+    Unpickle a file through a read-only memory map
+    
+    The unpickler reads straight from the page cache instead of issuing
+    many small reads through Python's buffered reader, and no copy of the
+    file is held in process memory.
+    """
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return pickle.loads(mm)
+
+
+def iter_chunks(items, total, desc, chunk_size=PROGRESS_INTERVAL):
+    """
+    Yield items in lists of chunk_size, printing progress after each list
+    
+    Keeps progress reporting out of the caller's per-item loop.
+    """
+    items = iter(items)
+    done = 0
+    while chunk := list(islice(items, chunk_size)):
+        yield chunk
+        done += len(chunk)
+        print(f"\r{desc}: {done:,}/{total:,}", end="", flush=True)
+    print()
+
+
+def json_default(obj):
+    """Convert NumPy values for the stdlib JSON encoder"""
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def encode_json(obj):
+    """Encode obj as indented JSON bytes, using orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(
+            obj, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY
+        )
+    return json.dumps(obj, indent=2, default=json_default).encode()
+
+
+def write_json(path, obj):
+    """Write obj as indented JSON, using orjson when it is installed"""
+    if orjson is not None:
+        with open(path, 'wb') as f:
+            f.write(encode_json(obj))
+        return
+    
+    # json.dump emits many small chunks, the buffer turns them into few
+    # writes without building the whole document in memory first
+    with open(path, 'w', buffering=JSON_BUFFER_SIZE) as f:
+        json.dump(obj, f, indent=2, default=json_default)
\ No newline at end of file
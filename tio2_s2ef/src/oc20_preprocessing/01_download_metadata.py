@@ -3,14 +3,19 @@ Step 1: Download OC20 metadata file
 This file contains information about all systems in the OC20 dataset
 """
 
+import shutil
 import urllib.request
 from pathlib import Path
 import sys
+from tqdm import tqdm
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from oc20_preprocessing.oc20_path_config import DataPath, DownloadURLs
 
+# Chunk size used to copy the download stream to disk
+COPY_BUFFER_SIZE = 4 * 1024 * 1024
+
 def download_metadata():
     """Download OC20 data mapping file"""
     # Create metadata directory
@@ -33,10 +38,11 @@ def download_metadata():
     print(f"Saving to: {DataPath.OC20_MAPPING_FILE}")
     
     try:
-        urllib.request.urlretrieve(
-            DownloadURLs.OC20_METADATA_URL,
-            DataPath.OC20_MAPPING_FILE
-        )
+        with urllib.request.urlopen(DownloadURLs.OC20_METADATA_URL) as response:
+            total = int(response.headers.get('Content-Length', 0)) or None
+            with tqdm.wrapattr(response, 'read', total=total, desc="Downloading") as src:
+                with open(DataPath.OC20_MAPPING_FILE, 'wb') as f:
+                    shutil.copyfileobj(src, f, length=COPY_BUFFER_SIZE)
         print(f"\nDownload successful!")
         print(f"File size: {DataPath.OC20_MAPPING_FILE.stat().st_size / 1024:.2f} KB")
         print(f"Location: {DataPath.OC20_MAPPING_FILE.absolute()}")
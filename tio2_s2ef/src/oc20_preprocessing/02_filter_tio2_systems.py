@@ -3,15 +3,22 @@ Step 2: Filter TiO2 systems from OC20 metadata
 Identifies all systems containing titanium and oxygen in the bulk
 """
 
+import heapq
+import os
 import pickle
 from pathlib import Path
-from collections import Counter
+from operator import itemgetter
 import sys
-from tqdm import tqdm
-import json
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pa = None
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+from metadata_utils import iter_chunks, load_pickle, write_json
 from oc20_preprocessing.oc20_path_config import DataPath
 
 def load_metadata():
@@ -24,47 +31,130 @@ def load_metadata():
         return None
     
     print(f"\nLoading metadata from: {DataPath.OC20_MAPPING_FILE}")
-    with open(DataPath.OC20_MAPPING_FILE, 'rb') as f:
-        data = pickle.load(f)
+    data = load_pickle(DataPath.OC20_MAPPING_FILE)
     
     print(f"Loaded {len(data):,} total systems")
     return data
 
 
+def has_arrow_cache():
+    """Check for an Arrow cache at least as new as the OC20 mapping file"""
+    cache = DataPath.OC20_MAPPING_ARROW_FILE
+    mapping = DataPath.OC20_MAPPING_FILE
+    if pa is None or not cache.exists():
+        return False
+    return not mapping.exists() or cache.stat().st_mtime >= mapping.stat().st_mtime
+
+
+def save_arrow_cache(metadata):
+    """
+    Save the OC20 mapping as a columnar Arrow IPC file
+    
+    bulk_symbols is stored as its own column so later runs can filter without
+    touching the rest of the data. Each system's full info dict is kept as a
+    pickled blob that is only unpickled for matching rows.
+    """
+    table = pa.table({
+        'system_id': list(metadata.keys()),
+        'bulk_symbols': [info.get('bulk_symbols', '') for info in metadata.values()],
+        'info': [
+            pickle.dumps(info, protocol=pickle.HIGHEST_PROTOCOL)
+            for info in metadata.values()
+        ],
+    })
+    # Written to a temporary file and moved into place, so an interrupted
+    # run never leaves a truncated cache that looks up to date
+    cache = DataPath.OC20_MAPPING_ARROW_FILE
+    tmp_path = cache.with_name(cache.name + '.tmp')
+    with pa.OSFile(str(tmp_path), 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, cache)
+    print(f"Saved Arrow cache to: {DataPath.OC20_MAPPING_ARROW_FILE}")
+
+
+def filter_tio2_systems_cached():
+    """Filter systems containing Ti and O in bulk from the Arrow cache"""
+    print(f"\nFiltering TiO2 systems from: {DataPath.OC20_MAPPING_ARROW_FILE}")
+    
+    # Memory-mapped read, the columns are not copied into process memory
+    with pa.memory_map(str(DataPath.OC20_MAPPING_ARROW_FILE)) as source:
+        table = pa.ipc.open_file(source).read_all()
+        bulks = table['bulk_symbols']
+        mask = pc.and_(
+            pc.match_substring(bulks, 'Ti'),
+            pc.match_substring(bulks, 'O'),
+        )
+        matches = table.filter(mask)
+        tio2_systems = {
+            system_id: pickle.loads(info)
+            for system_id, info in zip(
+                matches['system_id'].to_pylist(),
+                matches['info'].to_pylist(),
+            )
+        }
+    
+    print(f"\nFound {len(tio2_systems):,} TiO2 systems")
+    print(f"  ({len(tio2_systems)/table.num_rows*100:.2f}% of total)")
+    
+    return tio2_systems
+
+
+class BulkMatchCache(dict):
+    """Memoized Ti/O check keyed by bulk_symbols string"""
+    def __missing__(self, bulk):
+        # Check if both Ti and O are present. Plain str containment already
+        # takes CPython's short-needle fast path; encoding to bytes first is
+        # several times slower, and this only runs once per distinct bulk.
+        hit = self[bulk] = 'Ti' in bulk and 'O' in bulk
+        return hit
+
+
 def filter_tio2_systems(metadata):
     """Filter systems containing Ti and O in bulk"""
     print("\nFiltering TiO2 systems...")
     
+    # Many systems share the same bulk, so each distinct bulk_symbols string
+    # is only checked once
+    bulk_matches = BulkMatchCache()
     tio2_systems = {}
     
-    for system_id, info in tqdm(metadata.items(), desc="Filtering"):
-        bulk = info.get('bulk_symbols', '')
-        
-        # Check if both Ti and O are present
-        if 'Ti' in bulk and 'O' in bulk:
-            tio2_systems[system_id] = info
-    
+    for chunk in iter_chunks(metadata.items(), len(metadata), "Filtering"):
+        tio2_systems.update({
+            system_id: info
+            for system_id, info in chunk
+            if bulk_matches[info.get('bulk_symbols', '')]
+        })
+
     print(f"\nFound {len(tio2_systems):,} TiO2 systems")
     print(f"  ({len(tio2_systems)/len(metadata)*100:.2f}% of total)")
     
     return tio2_systems
 
 
+def top_counts(counts, n=20):
+    """Return the n most frequent entries of a count dict, highest first"""
+    return dict(heapq.nlargest(n, counts.items(), key=itemgetter(1)))
+
+
 def analyze_tio2_systems(tio2_systems):
     """Analyze filtered TiO2 systems"""
-    # Collect statistics
-    adsorbates = Counter()
-    bulks = Counter()
-    miller_indices = Counter()
+    # Collect statistics in plain dicts, binding the lookups once
+    adsorbates = {}
+    bulks = {}
+    miller_indices = {}
+    ads_get = adsorbates.get
+    bulk_get = bulks.get
+    miller_get = miller_indices.get
     
     for info in tio2_systems.values():
         ads = info.get('ads_symbols', 'unknown')
         bulk = info.get('bulk_symbols', 'unknown')
         miller = str(info.get('miller_index', (0, 0, 0)))
         
-        adsorbates[ads] += 1
-        bulks[bulk] += 1
-        miller_indices[miller] += 1
+        adsorbates[ads] = ads_get(ads, 0) + 1
+        bulks[bulk] = bulk_get(bulk, 0) + 1
+        miller_indices[miller] = miller_get(miller, 0) + 1
 
     # Return stats as dictionary
     return {
@@ -72,9 +162,9 @@ def analyze_tio2_systems(tio2_systems):
         'unique_adsorbates': len(adsorbates),
         'unique_bulks': len(bulks),
         'unique_miller': len(miller_indices),
-        'top_adsorbates': dict(adsorbates.most_common(20)),
-        'top_bulks': dict(bulks.most_common(20)),
-        'top_miller': dict(miller_indices.most_common(20))
+        'top_adsorbates': top_counts(adsorbates),
+        'top_bulks': top_counts(bulks),
+        'top_miller': top_counts(miller_indices)
     }
 
 
@@ -86,29 +176,39 @@ def save_results(tio2_systems, stats):
     
     # Save filtered mapping
     with open(DataPath.TIO2_MAPPING_FILE, 'wb') as f:
-        pickle.dump(tio2_systems, f)
+        pickle.dump(tio2_systems, f, protocol=pickle.HIGHEST_PROTOCOL)
     print(f"\nSaved TiO2 mapping to: {DataPath.TIO2_MAPPING_FILE}")
     
-    # Save system IDs (one per line)
+    # Save system IDs (one per line) with a single write
     with open(DataPath.TIO2_SYSTEM_IDS_FILE, 'w') as f:
-        for sid in sorted(tio2_systems.keys()):
-            f.write(f"{sid}\n")
+        f.write("".join(f"{sid}\n" for sid in sorted(tio2_systems)))
     print(f"Saved {len(tio2_systems):,} system IDs to: {DataPath.TIO2_SYSTEM_IDS_FILE}")
     
     # Save statistics as JSON
-    with open(DataPath.TIO2_STATISTICS_FILE, 'w') as f:
-        json.dump(stats, f, indent=2)
+    write_json(DataPath.TIO2_STATISTICS_FILE, stats)
     print(f"Saved statistics to: {DataPath.TIO2_STATISTICS_FILE}")
 
 if __name__ == "__main__":
     print("\n" + "=" * 60)
     print("STEP 2:TiO2 System Analysis")
     
-    # Load metadata
-    metadata = load_metadata()
-    
-    # Filter TiO2 systems
-    tio2_systems = filter_tio2_systems(metadata)
+    if has_arrow_cache():
+        # Filter TiO2 systems from the columnar cache of an earlier run
+        tio2_systems = filter_tio2_systems_cached()
+    else:
+        # Load metadata
+        metadata = load_metadata()
+        
+        # Filter TiO2 systems
+        tio2_systems = filter_tio2_systems(metadata)
+        
+        # Cache the mapping in columnar form for later runs
+        if pa is not None:
+            save_arrow_cache(metadata)
+        
+        # Release the full OC20 mapping before analysis, only the TiO2 subset
+        # is needed from here on
+        del metadata
     
     # Analyze
     stats = analyze_tio2_systems(tio2_systems)
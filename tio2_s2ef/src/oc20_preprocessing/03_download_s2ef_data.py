@@ -3,49 +3,209 @@ Step 3: Download S2EF dataset from OC20
 Uses FAIRChem's download script to get trajectory data
 """
 
+import io
+import lzma
+import multiprocessing as mp
 import os
+import shutil
 import sys
 import tarfile
+import threading
 import urllib.request
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from tqdm import tqdm
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+from download_utils import download_file
 from oc20_preprocessing.oc20_path_config import S2EFDataPath, DownloadURLs
 
+# Number of threads writing extracted files
+EXTRACT_WORKERS = 32
 
-class DownloadProgressBar(tqdm):
-    """Progress bar for downloads"""
-    def update_to(self, b=1, bsize=1, tsize=None):
-        if tsize is not None:
-            self.total = tsize
-        self.update(b * bsize - self.n)
+# Number of processes extracting a local tar archive
+EXTRACT_PROCESSES = os.cpu_count() or 1
 
+# Approximate bytes of tar members handed to an extraction process per job
+EXTRACT_RANGE_SIZE = 4 * 1024 * 1024
 
-def download_file(url, output_path):
-    """Download file with progress bar"""
-    print(f"Downloading to: {output_path}")
+# Read buffer for the tar archive and .xz decoding (the defaults are 8-10 KiB)
+IO_BUFFER_SIZE = 256 * 1024
+
+# Write buffer for each extracted file
+OUTPUT_BUFFER_SIZE = 1 << 20
+
+# Compressed S2EF members that are decompressed while extracting
+XZ_SUFFIXES = ("txt.xz", "extxyz.xz")
+
+
+def write_file(output_path, data, decompress=False):
+    """Write one extracted tar member to disk"""
+    with open(output_path, 'wb', buffering=OUTPUT_BUFFER_SIZE) as f:
+        if decompress:
+            # Stream the .xz payload through lzma, which releases the GIL
+            # while decoding, so decompression overlaps the tar reads
+            with lzma.open(io.BytesIO(data)) as src:
+                shutil.copyfileobj(src, f, IO_BUFFER_SIZE)
+        else:
+            f.write(data)
+
+
+def write_member(output_path, data, slots, decompress=False):
+    """Write one extracted tar member to disk and free its queue slot"""
+    try:
+        write_file(output_path, data, decompress)
+    finally:
+        slots.release()
+
+
+def prepare_member(member, extract_to, decompress_to, created_dirs):
+    """
+    Resolve where a tar member is written and create its directory
+    
+    Returns (output_path, decompress) for regular files, None for anything
+    else. Created directories are memoized in created_dirs so each is only
+    made once. Raises tarfile.TarError for names that would land outside
+    extract_to.
+    """
+    # Only file contents are written, so tarfile's extraction filters never
+    # run. Absolute names and '..' components are rejected here instead.
+    name = Path(member.name)
+    if name.anchor or '..' in name.parts:
+        raise tarfile.TarError(f"Refusing to extract {member.name!r} outside {extract_to}")
+    
+    decompress = (
+        decompress_to is not None
+        and member.isfile()
+        and member.name.endswith(XZ_SUFFIXES)
+    )
+    if decompress:
+        output_path = decompress_to / name.name[:-3]
+    else:
+        output_path = extract_to / member.name
     
-    output_path.parent.mkdir(parents=True, exist_ok=True)
+    if member.isdir():
+        directory = output_path
+    elif member.isfile():
+        directory = output_path.parent
+    else:
+        return None
     
-    with DownloadProgressBar(unit='B', unit_scale=True, miniters=1, desc="Downloading") as t:
-        urllib.request.urlretrieve(url, output_path, reporthook=t.update_to)
+    if directory not in created_dirs:
+        directory.mkdir(parents=True, exist_ok=True)
+        created_dirs.add(directory)
+    if member.isdir():
+        return None
+    return output_path, decompress
+
+
+def extract_members(tar, extract_to, decompress_to=None, num_workers=EXTRACT_WORKERS, progress=True):
+    """
+    Extract the regular files of an open tar archive
+    
+    Works on both seekable ('r') and streaming ('r|') archives since members
+    are consumed strictly in archive order. Only file contents are written,
+    mtime and permission updates are skipped.
     
-    size_gb = output_path.stat().st_size / (1024**3)
-    print(f"Downloaded: {size_gb:.2f} GB")
+    If decompress_to is given, .txt.xz and .extxyz.xz members are
+    decompressed straight into that directory instead of being written
+    to extract_to.
+    """
+    created_dirs = {extract_to}
+    
+    # tarfile is not thread-safe, so members are read on this thread and
+    # only the file writes are fanned out. The semaphore bounds how many
+    # member buffers can be waiting in memory.
+    slots = threading.BoundedSemaphore(num_workers * 2)
+    
+    # Failed writes are recorded as they finish, so reading stops at the
+    # first error instead of after the whole archive
+    failed = []
+    def record_failure(future):
+        if future.exception() is not None:
+            failed.append(future)
+    
+    with ThreadPoolExecutor(max_workers=num_workers) as pool:
+        for member in tqdm(tar, desc="Extracting", disable=not progress):
+            if failed:
+                break
+            target = prepare_member(member, extract_to, decompress_to, created_dirs)
+            if target is None:
+                continue
+            output_path, decompress = target
+            
+            data = tar.extractfile(member).read()
+            slots.acquire()
+            future = pool.submit(write_member, output_path, data, slots, decompress)
+            future.add_done_callback(record_failure)
+    
+    # The pool has waited for the writes still in flight
+    if failed:
+        failed[0].result()
+
+
+def extract_range(job):
+    """Extract a range of tar members by reading their data offsets directly"""
+    tar_path, members = job
+    with open(tar_path, 'rb', buffering=0) as f:
+        for offset, size, output_path, decompress in members:
+            f.seek(offset)
+            write_file(output_path, f.read(size), decompress)
+    return sum(member[1] for member in members)
 
 
-def extract_tar(tar_path, extract_to):
-    """Extract tar file with progress bar"""
+def extract_tar(tar_path, extract_to, decompress_to=None, num_processes=EXTRACT_PROCESSES):
+    """Extract a local tar file across processes with progress bar"""
     print(f"Extracting: {tar_path.name}")
     
     extract_to.mkdir(parents=True, exist_ok=True)
     
+    # Index the archive first. On a seekable file getmembers() only reads
+    # the 512-byte headers and seeks over the member data.
     with tarfile.open(tar_path, 'r') as tar:
         members = tar.getmembers()
-        for member in tqdm(members, desc="Extracting"):
-            tar.extract(member, path=extract_to)
+    
+    # Group regular files into ranges of about EXTRACT_RANGE_SIZE bytes,
+    # directories are created here so workers only write files
+    created_dirs = {extract_to}
+    jobs = []
+    current = []
+    current_size = 0
+    for member in members:
+        target = prepare_member(member, extract_to, decompress_to, created_dirs)
+        if target is None:
+            continue
+        current.append((member.offset_data, member.size, *target))
+        current_size += member.size
+        if current_size >= EXTRACT_RANGE_SIZE:
+            jobs.append((tar_path, current))
+            current = []
+            current_size = 0
+    if current:
+        jobs.append((tar_path, current))
+    
+    # Each process opens its own handle on the tar and seeks to its members.
+    # Ranges are handed out one at a time, so fast workers pick up the rest.
+    total = sum(member.size for member in members if member.isfile())
+    with tqdm(total=total, unit='B', unit_scale=True, desc="Extracting") as pbar:
+        if jobs:
+            with mp.Pool(min(num_processes, len(jobs))) as pool:
+                for done in pool.imap_unordered(extract_range, jobs, chunksize=1):
+                    pbar.update(done)
+    
+    print(f"Extracted to: {extract_to}")
+
+
+def stream_extract_tar(url, extract_to, decompress_to=None):
+    """Download a tar archive and extract it on the fly, without saving the .tar"""
+    print(f"Streaming from: {url}")
+    
+    extract_to.mkdir(parents=True, exist_ok=True)
+    
+    with urllib.request.urlopen(url) as response:
+        with tarfile.open(fileobj=response, mode='r|', bufsize=IO_BUFFER_SIZE) as tar:
+            extract_members(tar, extract_to, decompress_to)
     
     print(f"Extracted to: {extract_to}")
 
@@ -86,50 +246,27 @@ def download_and_uncompress_s2ef(split="200k"):
     uncompressed_dir.mkdir(parents=True, exist_ok=True)
     
     # Download
+    download = True
     if tar_path.exists():
         print(f"{tar_path.name} exists.")
         response = input("Re-download? (y/n): ").lower()
-        if response == 'y':
+        download = response == 'y'
+        if download:
             tar_path.unlink()
-            download_file(url, tar_path)
-    else:
-        download_file(url, tar_path)
-    
-    # Extract tar to raw directory
-    print("\nExtracting tar file...")
-    extract_tar(tar_path, raw_dir)
     
-    # Find compressed directory
-    compressed_base = raw_dir / f"s2ef_train_{split.upper()}"
-    compressed_dir = compressed_base / f"s2ef_train_{split.upper()}"
-    
-    if not compressed_dir.exists():
-        # Try to find .xz files in subdirectories
-        possible_dirs = list(compressed_base.rglob("*.xz"))
-        if possible_dirs:
-            compressed_dir = possible_dirs[0].parent
-        else:
-            print(f"Error: Could not find compressed files in {compressed_base}")
-            print("Contents:")
-            for item in compressed_base.rglob("*"):
-                print(f"  {item.relative_to(compressed_base)}")
-            return
-    
-    xz_files = list(compressed_dir.glob("*.xz"))
-    print(f"\nFound {len(xz_files)} compressed files in {compressed_dir}")
-    
-    # Uncompress to uncompressed_data directory
-    print("\nUncompressing data...")
-    
-    # Import here to avoid circular imports
-    from scripts.uncompress import main as uncompress_main
-    
-    class UncompressArgs:
-        ipdir = str(compressed_dir)
-        opdir = str(uncompressed_dir)
-        num_workers = 8
-    
-    uncompress_main(UncompressArgs())
+    # Extract tar to raw directory, decompressing the .xz trajectory files
+    # straight into the uncompressed directory on the way
+    if not download:
+        print("\nExtracting and uncompressing tar file...")
+        extract_tar(tar_path, raw_dir, uncompressed_dir)
+    elif input("Keep a copy of the downloaded .tar file? (y/n): ").lower() == 'y':
+        download_file(url, tar_path)
+        print("\nExtracting and uncompressing tar file...")
+        extract_tar(tar_path, raw_dir, uncompressed_dir)
+    else:
+        # Extract while downloading, the .tar never touches the disk
+        print("\nDownloading, extracting and uncompressing tar file...")
+        stream_extract_tar(url, raw_dir, uncompressed_dir)
     
     # Verify
     txt_files = list(uncompressed_dir.glob("*.txt"))
@@ -140,17 +277,19 @@ def download_and_uncompress_s2ef(split="200k"):
         print("Warning: Missing expected files!")
         return
     
-    # Cleanup
-    print()
-    response = input("Delete compressed files to save space? (y/n): ").lower()
-    if response == 'y':
-        import shutil
-        if tar_path.exists():
-            tar_path.unlink()
-            print(f"Deleted: {tar_path.name}")
-        if compressed_base.exists():
-            shutil.rmtree(compressed_base)
-            print(f"Deleted: {compressed_base.name}")
+    # Cleanup, only the .tar (and compressed files left by older runs of
+    # this script) remain to be removed
+    compressed_base = raw_dir / f"s2ef_train_{split.upper()}"
+    if tar_path.exists() or compressed_base.exists():
+        print()
+        response = input("Delete compressed files to save space? (y/n): ").lower()
+        if response == 'y':
+            if tar_path.exists():
+                tar_path.unlink()
+                print(f"Deleted: {tar_path.name}")
+            if compressed_base.exists():
+                shutil.rmtree(compressed_base)
+                print(f"Deleted: {compressed_base.name}")
     
     print(f"\nRaw data location: {raw_dir.absolute()}")
     print(f"Uncompressed data location: {uncompressed_dir.absolute()}")
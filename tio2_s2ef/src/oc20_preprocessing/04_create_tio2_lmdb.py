@@ -4,16 +4,25 @@ Processes extxyz and txt files, then filters to keep only TiO2 systems
 """
 
 import glob
+import heapq
+import io
 import multiprocessing as mp
 import os
 import pickle
+import re
 import sys
+from functools import lru_cache
+from itertools import islice
 from pathlib import Path
 
-import ase.io
+import ase
 import lmdb
 import numpy as np
 import torch
+from ase.calculators.singlepoint import SinglePointCalculator
+from ase.constraints import FixAtoms
+from ase.data import atomic_numbers
+from torch_geometric.data import Data
 from tqdm import tqdm
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
@@ -34,6 +43,18 @@ except ImportError as e:
     print(f"\nExpected file: {root_dir / 'ocpmodels' / 'preprocessing' / 'atoms_to_graphs.py'}")
     sys.exit(1)
 
+# Number of records written per LMDB transaction
+COMMIT_INTERVAL = 1000
+
+# Write buffer of each worker's frame ID log
+LOG_BUFFER_SIZE = 1 << 20
+
+# Maximum size of each worker's LMDB, only used pages take up disk space
+LMDB_MAP_SIZE = 1024**3 * 100  # 100 GB
+
+# key=value and key="quoted value" pairs on an extxyz comment line
+EXTXYZ_INFO = re.compile(r'(\w+)=(?:"([^"]*)"|(\S*))')
+
 
 def load_tio2_system_ids():
     """Load TiO2 system IDs"""
@@ -61,19 +82,201 @@ def load_tio2_system_ids():
             system_ids.add(sid)
     
     print(f"Loaded {len(system_ids):,} TiO2 system IDs")
-    return system_ids
+    return frozenset(system_ids)
+
+
+class RecordPickler(pickle.Pickler):
+    """
+    Pickler for LMDB records that stores tensors as NumPy arrays
+    
+    torch pickles every tensor storage through a nested torch.save, which
+    dominates the cost of a small record. Reducing tensors to
+    torch.from_numpy(array) lets pickle copy the raw array data directly,
+    and records still load with plain pickle.loads.
+    """
+    def reducer_override(self, obj):
+        if type(obj) is torch.Tensor and obj.device.type == "cpu" and not obj.requires_grad:
+            try:
+                return torch.from_numpy, (obj.numpy(),)
+            except TypeError:
+                # dtype without a NumPy equivalent, use torch's own reduction
+                pass
+        return NotImplemented
+
+
+class FrameToGraphs(AtomsToGraphs):
+    """
+    AtomsToGraphs specialized for the frames built by read_extxyz
+    
+    Step 4 never computes edges, so convert builds the Data object directly
+    from the frame's NumPy arrays and calculator results, one float32 cast
+    per tensor, instead of going through ASE's copying getters and
+    torch.Tensor. Tags are stored as int64, as in the written records.
+    """
+    def convert(self, atoms):
+        if self.r_edges:
+            return super().convert(atoms)
+        
+        natoms = len(atoms)
+        arrays = atoms.arrays
+        tags = arrays.get("tags")
+        if tags is None:
+            tags = np.zeros(natoms, dtype=np.int64)
+        
+        data = Data(
+            cell=torch.from_numpy(atoms.cell.array.astype(np.float32)).view(1, 3, 3),
+            pos=torch.from_numpy(arrays["positions"].astype(np.float32)),
+            atomic_numbers=torch.from_numpy(arrays["numbers"].astype(np.float32)),
+            natoms=natoms,
+            tags=torch.from_numpy(np.asarray(tags, dtype=np.int64)),
+        )
+        if self.r_energy:
+            data.y = atoms.calc.results["energy"]
+        if self.r_forces:
+            data.force = torch.from_numpy(
+                atoms.calc.results["forces"].astype(np.float32)
+            )
+        if self.r_fixed:
+            fixed = np.zeros(natoms, dtype=np.float32)
+            for constraint in atoms.constraints:
+                if isinstance(constraint, FixAtoms):
+                    fixed[constraint.index] = 1
+            data.fixed = torch.from_numpy(fixed)
+        
+        return data
+
+
+@lru_cache(maxsize=None)
+def parse_properties(properties):
+    """
+    Parse an extxyz Properties string
+    
+    Returns a column slice per property, the total column count and the
+    indices of the text (S and L type) columns.
+    """
+    fields = properties.split(":")
+    columns = {}
+    text_columns = []
+    start = 0
+    for name, kind, count in zip(fields[0::3], fields[1::3], fields[2::3]):
+        stop = start + int(count)
+        columns[name] = slice(start, stop)
+        if kind in ("S", "L"):
+            text_columns.extend(range(start, stop))
+        start = stop
+    return columns, start, text_columns
+
+
+def read_extxyz(f, keep=None):
+    """
+    Read frames of an S2EF extxyz trajectory
+    
+    Minimal reader for the fields step 4 uses (species, pos, move_mask,
+    tags, forces, energy, Lattice, pbc). The text columns of each atom block
+    are pulled out first, then all numeric columns are converted to one
+    float array in a single pass, instead of going through ASE's generic
+    extxyz machinery.
+    
+    If keep is given, only the frames at those indices are parsed and
+    returned. Other frames are skipped line by line, and reading stops
+    after the last kept frame.
+    """
+    frames = []
+    last = max(keep) if keep is not None else None
+    index = -1
+    while last is None or index < last:
+        header = f.readline()
+        if not header.strip():
+            break
+        natoms = int(header)
+        index += 1
+        
+        if keep is not None and index not in keep:
+            for _ in islice(f, natoms + 1):
+                pass
+            continue
+        
+        info = {
+            key: quoted or value
+            for key, quoted, value in EXTXYZ_INFO.findall(f.readline())
+        }
+        columns, ncols, text_columns = parse_properties(info["Properties"])
+        
+        tokens = "".join(islice(f, natoms)).split()
+        species = tokens[columns["species"].start::ncols]
+        if "move_mask" in columns:
+            fixed = np.array(tokens[columns["move_mask"].start::ncols]) == "F"
+        # Blank out text columns so the whole block converts at once
+        padding = ["0"] * natoms
+        for column in text_columns:
+            tokens[column::ncols] = padding
+        values = np.array(tokens, dtype=np.float64).reshape(natoms, ncols)
+        
+        atoms = ase.Atoms(
+            numbers=[atomic_numbers[symbol] for symbol in species],
+            positions=values[:, columns["pos"]],
+            cell=np.array(info["Lattice"].split(), dtype=np.float64).reshape(3, 3)
+            if "Lattice" in info else None,
+            pbc=[flag == "T" for flag in info.get("pbc", "T T T").split()],
+        )
+        if "tags" in columns:
+            atoms.set_tags(values[:, columns["tags"].start].astype(np.int64))
+        if "move_mask" in columns:
+            atoms.set_constraint(FixAtoms(mask=fixed))
+        
+        results = {}
+        if "energy" in info:
+            results["energy"] = float(info["energy"])
+        if "forces" in columns:
+            results["forces"] = values[:, columns["forces"]]
+        atoms.calc = SinglePointCalculator(atoms, **results)
+        
+        frames.append(atoms)
+    return frames
+
+
+def split_by_size(paths, num_chunks):
+    """
+    Split files into num_chunks lists of roughly equal total size
+    
+    Largest files first, each going to the currently lightest chunk
+    (longest-processing-time-first). Trajectory logs vary a lot in length,
+    so this balances the workers far better than equal file counts.
+    """
+    chunks = [[] for _ in range(num_chunks)]
+    heap = [(0, i) for i in range(num_chunks)]
+    sizes = sorted(((os.path.getsize(path), path) for path in paths), reverse=True)
+    for size, path in sizes:
+        total, i = heapq.heappop(heap)
+        chunks[i].append(path)
+        heapq.heappush(heap, (total + size, i))
+    return chunks
+
+
+def init_worker(converter, system_ids):
+    """Store the state shared by all of a worker's tasks once per process"""
+    global a2g, tio2_ids
+    a2g = converter
+    tio2_ids = system_ids
 
 
 def write_images_to_lmdb(mp_arg):
     """Process extxyz files and write to LMDB with TiO2 filtering"""
-    a2g, db_path, samples, sampled_ids, idx, pid, tio2_ids = mp_arg
+    db_path, log_path, samples, idx, pid = mp_arg
     
     db = lmdb.open(
         db_path,
-        map_size=1024 * 1024 * 1024 * 10,  # 100 GB
+        map_size=LMDB_MAP_SIZE,
         subdir=False,
         meminit=False,
+        # Puts go straight into the memory map instead of through a
+        # separate write buffer. Windows grows the file to the full map
+        # size with writemap, so it keeps the default there
+        writemap=sys.platform != "win32",
         map_async=True,
+        # Bulk load, flushed once with sync() at the end
+        sync=False,
+        metasync=False,
     )
 
     pbar = tqdm(
@@ -85,91 +288,120 @@ def write_images_to_lmdb(mp_arg):
     kept_count = 0
     skipped_count = 0
     
+    # Batch puts into one write transaction per COMMIT_INTERVAL records
+    txn = db.begin(write=True)
+    pending = 0
+    
+    # Kept frame IDs are streamed to the worker's log as they are written
+    ids_log = open(log_path, "w", buffering=LOG_BUFFER_SIZE)
+    
+    # One buffer and pickler reused for every record
+    buffer = io.BytesIO()
+    pickler = RecordPickler(buffer, protocol=pickle.HIGHEST_PROTOCOL)
+    
     for sample in samples:
         # Read trajectory log file
         try:
-            traj_logs = open(sample, "r").read().splitlines()
+            with open(sample, "r") as f:
+                traj_logs = f.read().splitlines()
         except:
             continue
         
-        # Get corresponding extxyz file
-        xyz_idx = os.path.splitext(os.path.basename(sample))[0]
-        traj_path = os.path.join(os.path.dirname(sample), f"{xyz_idx}.extxyz")
-        
-        if not os.path.exists(traj_path):
-            continue
+        pbar.total = pbar.n + len(traj_logs)
         
-        # Read trajectory frames
-        try:
-            traj_frames = ase.io.read(traj_path, ":")
-        except:
-            continue
-        
-        pbar.total = pbar.n + len(traj_frames)
-        
-        for i, frame in enumerate(traj_frames):
-            if i >= len(traj_logs):
-                break
-            
-            frame_log = traj_logs[i].split(",")
-            
-            # Extract system ID and frame ID
+        # TiO2 filtering on the log lines first, so only TiO2 frames are
+        # parsed and trajectories without any never have their extxyz opened
+        keep = []
+        for i, line in enumerate(traj_logs):
+            # Extract system ID only, most lines are rejected on it alone
             try:
-                sid = int(frame_log[0].split("random")[1])
-                fid = int(frame_log[1].split("frame")[1])
+                sid = int(line.partition(",")[0].split("random")[1])
             except:
-                pbar.update(1)
                 continue
             
-            # TiO2 filtering - skip if not in TiO2 list
+            # Skip if not in TiO2 list
             if sid not in tio2_ids:
                 skipped_count += 1
-                pbar.update(1)
                 continue
             
+            # Extract frame ID for the kept lines
+            frame_log = line.split(",")
+            try:
+                fid = int(frame_log[1].split("frame")[1])
+            except:
+                continue
+            keep.append((i, sid, fid, frame_log))
+        
+        if not keep:
+            pbar.update(len(traj_logs))
+            continue
+        
+        # Get corresponding extxyz file, samples come from a "*.txt" glob so
+        # swapping the suffix is enough
+        traj_path = sample[:-len(".txt")] + ".extxyz"
+        
+        # Read the TiO2 trajectory frames from a single open handle. A
+        # missing file fails here instead of costing a separate exists() check
+        try:
+            with open(traj_path, "r") as f:
+                traj_frames = read_extxyz(f, {entry[0] for entry in keep})
+        except:
+            pbar.update(len(traj_logs))
+            continue
+        
+        for (i, sid, fid, frame_log), frame in zip(keep, traj_frames):
             # Convert to graph
             try:
                 data_object = a2g.convert(frame)
             except:
-                pbar.update(1)
                 continue
             
-            # Add metadata
-            data_object.tags = torch.LongTensor(frame.get_tags())
+            # Add metadata, tags are already set by FrameToGraphs
             data_object.sid = sid
             data_object.fid = fid
             
             # Write to LMDB
-            txn = db.begin(write=True)
-            txn.put(
-                f"{idx}".encode("ascii"),
-                pickle.dumps(data_object, protocol=-1),
-            )
-            txn.commit()
+            buffer.seek(0)
+            buffer.truncate()
+            pickler.clear_memo()
+            pickler.dump(data_object)
+            with buffer.getbuffer() as value:
+                txn.put(f"{idx}".encode("ascii"), value)
+            pending += 1
+            if pending == COMMIT_INTERVAL:
+                txn.commit()
+                txn = db.begin(write=True)
+                pending = 0
             
             idx += 1
             kept_count += 1
-            sampled_ids.append(",".join(frame_log[:2]) + "\n")
-            pbar.update(1)
+            ids_log.write(",".join(frame_log[:2]) + "\n")
+        
+        pbar.update(len(traj_logs))
 
-    # Save count
-    txn = db.begin(write=True)
+    # Save count with the last batch
     txn.put("length".encode("ascii"), pickle.dumps(idx, protocol=-1))
     txn.commit()
 
-    db.sync()
+    db.sync(True)
+    # With writemap the file is extended to the whole map size, cut it back
+    # to the pages actually in use
+    used_size = (db.info()["last_pgno"] + 1) * db.stat()["psize"]
     db.close()
+    if os.path.getsize(db_path) > used_size:
+        os.truncate(db_path, used_size)
+    ids_log.close()
     pbar.close()
 
-    return sampled_ids, idx, kept_count, skipped_count
+    return pid, idx, kept_count, skipped_count
 
 
 def main():
     print("=" * 60)
     print("STEP 4: Create TiO2-Filtered LMDB")
     
-    # Configuration
-    NUM_WORKERS = 1 
+    # Configuration, leave one core free for the parent process
+    NUM_WORKERS = max(1, (os.cpu_count() or 1) - 1)
     
     # Uncompressed S2EF data
     DATA_PATH = DataPath.UNCOMPRESSED_200K_DIR
@@ -206,7 +438,7 @@ def main():
         print(f"Adjusted workers to {num_workers} (number of txt files)")
     
     # Initialize feature extractor
-    a2g = AtomsToGraphs(
+    a2g = FrameToGraphs(
         max_neigh=50,
         radius=6,
         r_energy=True,
@@ -225,47 +457,47 @@ def main():
         for i in range(num_workers)
     ]
     
-    # Chunk files
-    chunked_txt_files = np.array_split(txt_files, num_workers)
+    # Chunk files, balanced by size
+    chunked_txt_files = split_by_size(txt_files, num_workers)
     
     # Process in parallel
-    sampled_ids = [[]] * num_workers
     idx = [0] * num_workers
     
     print(f"\nProcessing with {num_workers} workers...")
     
-    pool = mp.Pool(num_workers)
+    # Fork where available so workers inherit the parent's memory
+    # copy-on-write instead of re-importing everything
+    if "fork" in mp.get_all_start_methods():
+        ctx = mp.get_context("fork")
+    else:
+        ctx = mp.get_context()
+    # The converter and TiO2 IDs go to each worker once through the
+    # initializer, inherited without pickling under fork, so task
+    # arguments stay small
+    pool = ctx.Pool(num_workers, initializer=init_worker, initargs=(a2g, tio2_ids))
     mp_args = [
         (
-            a2g,
             db_paths[i],
+            str(OUT_PATH / f"data_log.{i:04d}.txt"),
             chunked_txt_files[i],
-            sampled_ids[i],
             idx[i],
             i,
-            tio2_ids,
         )
         for i in range(num_workers)
     ]
     
-    results = list(pool.imap(write_images_to_lmdb, mp_args))
+    # Collect results as workers finish, placed back by worker index
+    results = [None] * num_workers
+    for result in pool.imap_unordered(write_images_to_lmdb, mp_args, chunksize=1):
+        results[result[0]] = result
     pool.close()
     pool.join()
     
     # Unpack results
-    sampled_ids = [r[0] for r in results]
     idx = [r[1] for r in results]
     kept_counts = [r[2] for r in results]
     skipped_counts = [r[3] for r in results]
     
-    # Save logs
-    for j, i in enumerate(range(num_workers)):
-        ids_log = open(
-            str(OUT_PATH / f"data_log.{i:04d}.txt"), "w"
-        )
-        ids_log.writelines(sampled_ids[j])
-        ids_log.close()
-    
     # Print summary
     total_kept = sum(kept_counts)
     total_skipped = sum(skipped_counts)
@@ -0,0 +1,259 @@
+"""
+Step 5: Compute normalization statistics for the TiO2 LMDB
+Streams energies and forces from the filtered LMDB shards and saves the
+target_mean/target_std and grad_target_mean/grad_target_std used for training
+"""
+
+import glob
+import io
+import os
+import pickle
+import sys
+from pathlib import Path
+
+import lmdb
+import numpy as np
+
+# Private torch helpers behind tensor pickling, used to decode only the
+# energy and force tensors. Records are unpickled normally without them
+try:
+    from torch._utils import _rebuild_tensor_v2
+    from torch.storage import _load_from_bytes
+except ImportError:
+    _rebuild_tensor_v2 = _load_from_bytes = None
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from metadata_utils import write_json
+from oc20_preprocessing.oc20_path_config import DataPath
+
+# Records whose forces are concatenated into one array per statistics update
+FORCE_BATCH_SIZE = 4096
+
+
+class LazyTensor:
+    """Pickled tensor whose storage is only decoded when materialized"""
+    def __init__(self, storage_bytes, *rebuild_args):
+        self.storage_bytes = storage_bytes
+        self.rebuild_args = rebuild_args
+
+    def materialize(self):
+        """Rebuild the tensor the way torch's own unpickling would"""
+        storage = _load_from_bytes(self.storage_bytes)
+        return _rebuild_tensor_v2(storage, *self.rebuild_args)
+
+
+class Record:
+    """Stand-in for pickled torch_geometric objects, keeps only their state"""
+    def __new__(cls, *args, **kwargs):
+        return object.__new__(cls)
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+
+class TargetUnpickler(pickle.Unpickler):
+    """
+    Unpickler for LMDB records that only needs energy and forces
+    
+    Data objects are loaded as plain Records, and tensors pickled by torch
+    as LazyTensors holding their raw storage bytes, so the unused pos, cell,
+    atomic_numbers, fixed and tags tensors are never rebuilt. Tensors
+    written as NumPy arrays by step 4 are cheap to load and come back as
+    regular tensors.
+    """
+    def find_class(self, module, name):
+        if module == "torch._utils" and name == "_rebuild_tensor_v2":
+            return LazyTensor
+        if module == "torch.storage" and name == "_load_from_bytes":
+            # Keep the storage payload as the raw bytes object
+            return bytes
+        if module.startswith("torch_geometric."):
+            return Record
+        return super().find_class(module, name)
+
+
+def load_targets(value):
+    """Return (energy, forces) of one pickled LMDB record"""
+    if _rebuild_tensor_v2 is None:
+        data = pickle.loads(value)
+        return float(data.y), data.force
+    
+    record = TargetUnpickler(io.BytesIO(value)).load()
+    
+    # PyG 2.x keeps attributes in a storage mapping, older versions on
+    # the object itself
+    store = record.__dict__.get('_store', record)
+    fields = store.__dict__.get('_mapping', store.__dict__)
+    
+    energy, force = fields['y'], fields['force']
+    if isinstance(energy, LazyTensor):
+        energy = energy.materialize()
+    if isinstance(force, LazyTensor):
+        force = force.materialize()
+    return float(energy), force
+
+
+class RunningStats:
+    """
+    Streaming count/mean/variance/min/max over batches of values
+    
+    Each batch is reduced in NumPy and merged into the running state with
+    Welford's update (Chan et al. pairwise form), so values never have to be
+    collected in memory. min and max stay None until a value is seen.
+    """
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+
+    def update(self, values):
+        """Fold an array of values into the running statistics"""
+        n = values.size
+        if n == 0:
+            return
+        
+        batch_mean = values.mean(dtype=np.float64)
+        centered = values - batch_mean
+        batch_m2 = np.dot(centered.ravel(), centered.ravel())
+        
+        total = self.count + n
+        delta = batch_mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += batch_m2 + delta * delta * self.count * n / total
+        self.count = total
+        
+        batch_min = float(values.min())
+        batch_max = float(values.max())
+        self.min = batch_min if self.min is None else min(self.min, batch_min)
+        self.max = batch_max if self.max is None else max(self.max, batch_max)
+
+    @property
+    def std(self):
+        """Population standard deviation"""
+        return float(np.sqrt(self.m2 / self.count)) if self.count else 0.0
+
+
+def prefetch_file(path):
+    """Ask the kernel to start reading a whole file into the page cache"""
+    # posix_fadvise is not available on Windows
+    if not hasattr(os, "posix_fadvise"):
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+    finally:
+        os.close(fd)
+
+
+def compute_statistics(lmdb_paths):
+    """Scan LMDB shards once, collecting energy and force statistics"""
+    energies = []
+    force_stats = RunningStats()
+    force_chunks = []
+    
+    for lmdb_path in lmdb_paths:
+        print(f"\nReading: {lmdb_path}")
+        
+        # Every record is scanned in order, so let the kernel read ahead
+        # instead of faulting in one page at a time
+        prefetch_file(lmdb_path)
+        env = lmdb.open(
+            str(lmdb_path),
+            subdir=False,
+            readonly=True,
+            lock=False,
+            readahead=True,
+            max_readers=1,
+            meminit=False,
+        )
+        
+        # Energies go into a buffer sized from the entry count and filled by
+        # index, the extra "length" entry is trimmed below
+        shard_energies = np.empty(env.stat()['entries'], dtype=np.float64)
+        n = 0
+        
+        with env.begin() as txn:
+            for key, value in txn.cursor():
+                if key == b"length":
+                    continue
+                
+                energy, force = load_targets(value)
+                shard_energies[n] = energy
+                n += 1
+                
+                # Zero-copy views of the force tensors, folded into the
+                # statistics a batch at a time to keep the NumPy work in C
+                force_chunks.append(force.numpy().ravel())
+                if len(force_chunks) == FORCE_BATCH_SIZE:
+                    force_stats.update(np.concatenate(force_chunks))
+                    force_chunks.clear()
+        
+        env.close()
+        
+        energies.append(shard_energies[:n])
+        print(f"  Records: {n:,}")
+    
+    if force_chunks:
+        force_stats.update(np.concatenate(force_chunks))
+    
+    energies = np.concatenate(energies) if energies else np.empty(0)
+    if energies.size == 0:
+        return None
+    
+    return {
+        'target_mean': float(energies.mean()),
+        'target_std': float(energies.std()),
+        'grad_target_mean': float(force_stats.mean),
+        'grad_target_std': force_stats.std,
+        'num_frames': int(energies.size),
+        'energy_min': float(energies.min()),
+        'energy_max': float(energies.max()),
+        'num_force_components': force_stats.count,
+        'force_min': force_stats.min,
+        'force_max': force_stats.max,
+    }
+
+
+def main():
+    print("=" * 60)
+    print("STEP 5: Compute TiO2 Normalization Statistics")
+    
+    # TiO2 LMDB written by step 4
+    LMDB_PATH = DataPath.TIO2_LMDB_200K_DIR
+    
+    lmdb_paths = sorted(glob.glob(str(LMDB_PATH / "data.*.lmdb")))
+    if not lmdb_paths:
+        print(f"\nError: No data.*.lmdb files found in {LMDB_PATH}")
+        print("Run 04_create_tio2_lmdb.py first")
+        return
+    
+    print(f"\nFound {len(lmdb_paths)} LMDB files")
+    
+    stats = compute_statistics(lmdb_paths)
+    if stats is None:
+        print("\nError: No records found")
+        return
+    if stats['num_force_components'] == 0:
+        print("\nError: No force components found")
+        return
+    
+    print(f"\nFrames: {stats['num_frames']:,}")
+    print(f"  target_mean: {stats['target_mean']:.6f}")
+    print(f"  target_std: {stats['target_std']:.6f}")
+    print(f"  grad_target_mean: {stats['grad_target_mean']:.6f}")
+    print(f"  grad_target_std: {stats['grad_target_std']:.6f}")
+    
+    # Save statistics as JSON
+    DataPath.METADATA_DIR.mkdir(parents=True, exist_ok=True)
+    write_json(DataPath.TIO2_NORMALIZATION_FILE, stats)
+    print(f"\nSaved statistics to: {DataPath.TIO2_NORMALIZATION_FILE}")
+    
+    print("STATISTICS COMPLETE")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
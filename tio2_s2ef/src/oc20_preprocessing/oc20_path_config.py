@@ -1,17 +1,4 @@
-from pathlib import Path
-
-
-class BasePath:
-    """Base directory paths"""
-    # Project root (where README.md, environment.yml)
-    PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
-    
-    # Main directories
-    SCRIPTS_DIR = PROJECT_ROOT / "scripts"
-    CONFIGS_DIR = PROJECT_ROOT / "configs"
-    NOTEBOOKS_DIR = PROJECT_ROOT / "notebooks"
-    TESTS_DIR = PROJECT_ROOT / "tests"
-    DOCS_DIR = PROJECT_ROOT / "docs"
+from path_config import BasePath, OutputPath
 
 
 class DataPath:
@@ -45,64 +32,56 @@ class DataPath:
     
     # Specific metadata files
     OC20_MAPPING_FILE = METADATA_DIR / "oc20_data_mapping.pkl"
+    OC20_MAPPING_ARROW_FILE = METADATA_DIR / "oc20_data_mapping.arrow"
     TIO2_MAPPING_FILE = METADATA_DIR / "tio2_data_mapping.pkl"
     TIO2_SYSTEM_IDS_FILE = METADATA_DIR / "tio2_system_ids.txt"
     TIO2_STATISTICS_FILE = METADATA_DIR / "tio2_statistics.json"
     TIO2_NORMALIZATION_FILE = METADATA_DIR / "tio2_normalization_stats.json"
 
 
-class OutputPath:
-    """Output paths for models, results, logs"""
-    # Model checkpoints
-    MODELS_DIR = BasePath.PROJECT_ROOT / "models"
-    CHECKPOINTS_DIR = BasePath.PROJECT_ROOT / "checkpoints"
-    
-    # Results and logs
-    RESULTS_DIR = BasePath.PROJECT_ROOT / "results"
-    LOGS_DIR = BasePath.PROJECT_ROOT / "logs"
-
-
 class S2EFDataPath:
     """S2EF dataset specific paths"""
     
+    # Split lookup tables, built once at import
+    RAW_DIRS = {
+        "200k": DataPath.RAW_200K_DIR,
+        "2M": DataPath.RAW_2M_DIR,
+        "20M": DataPath.RAW_20M_DIR,
+        "all": DataPath.RAW_ALL_DIR
+    }
+    UNCOMPRESSED_DIRS = {
+        "200k": DataPath.UNCOMPRESSED_200K_DIR,
+        "2M": DataPath.UNCOMPRESSED_2M_DIR,
+        "20M": DataPath.UNCOMPRESSED_20M_DIR,
+        "all": DataPath.UNCOMPRESSED_ALL_DIR
+    }
+    TIO2_LMDB_DIRS = {
+        "200k": DataPath.TIO2_LMDB_200K_DIR,
+        "2M": DataPath.TIO2_LMDB_2M_DIR,
+        "20M": DataPath.TIO2_LMDB_20M_DIR,
+        "all": DataPath.TIO2_LMDB_ALL_DIR
+    }
+    
     @staticmethod
     def get_raw_dir(split="200k"):
         """
         Get raw directory for specific split (contains compressed .tar and .xz files)
         """
-        split_dirs = {
-            "200k": DataPath.RAW_200K_DIR,
-            "2M": DataPath.RAW_2M_DIR,
-            "20M": DataPath.RAW_20M_DIR,
-            "all": DataPath.RAW_ALL_DIR
-        }
-        return split_dirs.get(split, DataPath.RAW_200K_DIR)
+        return S2EFDataPath.RAW_DIRS.get(split, DataPath.RAW_200K_DIR)
     
     @staticmethod
     def get_uncompressed_dir(split="200k"):
         """
         Get uncompressed directory for specific split (contains .txt and .extxyz files)
         """
-        split_dirs = {
-            "200k": DataPath.UNCOMPRESSED_200K_DIR,
-            "2M": DataPath.UNCOMPRESSED_2M_DIR,
-            "20M": DataPath.UNCOMPRESSED_20M_DIR,
-            "all": DataPath.UNCOMPRESSED_ALL_DIR
-        }
-        return split_dirs.get(split, DataPath.UNCOMPRESSED_200K_DIR)
+        return S2EFDataPath.UNCOMPRESSED_DIRS.get(split, DataPath.UNCOMPRESSED_200K_DIR)
     
     @staticmethod
     def get_tio2_lmdb_dir(split="200k"):
         """
         Get TiO2 LMDB directory for specific split
         """
-        split_dirs = {
-            "200k": DataPath.TIO2_LMDB_200K_DIR,
-            "2M": DataPath.TIO2_LMDB_2M_DIR,
-            "20M": DataPath.TIO2_LMDB_20M_DIR,
-            "all": DataPath.TIO2_LMDB_ALL_DIR
-        }
-        return split_dirs.get(split, DataPath.TIO2_LMDB_200K_DIR)
+        return S2EFDataPath.TIO2_LMDB_DIRS.get(split, DataPath.TIO2_LMDB_200K_DIR)
     
     @staticmethod
     def get_tar_file(split="200k"):
@@ -36,6 +36,7 @@ def main():
         "02_filter_tio2_systems.py",
         "03_download_s2ef_data.py",
         "04_create_tio2_lmdb.py",
+        "05_compute_statistics.py",
     ]
     
     print(f"\nThis will run {len(scripts)} preprocessing steps:")
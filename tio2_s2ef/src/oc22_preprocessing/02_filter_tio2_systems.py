@@ -3,19 +3,31 @@ Step 2: Filter TiO2 systems from OC22 metadata
 Identifies all systems with TiO2 stoichiometry (Ti:O ratio = 1:2)
 """
 
+import argparse
 import pickle
-import json
 import re
 from pathlib import Path
 from collections import Counter
-from fractions import Fraction
+from functools import lru_cache
+from itertools import islice
 import sys
-from tqdm import tqdm
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+from metadata_utils import (
+    JSON_BUFFER_SIZE, encode_json, iter_chunks, load_pickle, write_json,
+)
 from oc22_preprocessing.oc22_path_config import DataPath
 
+# Element symbol followed by an optional count, e.g. "Ti12" or "O"
+FORMULA_ELEMENT = re.compile(r'([A-Z][a-z]?)(\d*)')
+
+# Systems encoded per chunk when streaming a mapping to JSON
+JSON_CHUNK_SIZE = 1 << 12
+
+# The common "Ti<n>O<m>" spelling of a pure titanium oxide
+TIO_FORMULA = re.compile(r'Ti(\d*)O(\d*)')
+
 
 def parse_formula(bulk_symbols):
     """
@@ -23,39 +35,47 @@ def parse_formula(bulk_symbols):
     Example: "Ti12O24" -> {'Ti': 12, 'O': 24}
     """
     elements = {}
-    pattern = r'([A-Z][a-z]?)(\d*)'
-    matches = re.findall(pattern, bulk_symbols)
+    matches = FORMULA_ELEMENT.findall(bulk_symbols)
     
+    # The element group always captures a symbol, only the count is optional
     for element, count in matches:
-        if element:
-            count = int(count) if count else 1
-            elements[element] = count
+        elements[element] = int(count) if count else 1
     
     return elements
 
 
+@lru_cache(maxsize=None)
 def is_tio2(bulk_symbols):
     """
     Check if bulk_symbols represents TiO2 stoichiometry (Ti:O ratio = 1:2)
+    
+    Memoized, many systems share the same bulk so each distinct formula is
+    only checked once.
     """
-    elements = parse_formula(bulk_symbols)
+    # Fast path for formulas written as "Ti<n>O<m>"
+    match = TIO_FORMULA.fullmatch(bulk_symbols)
+    if match:
+        ti_count = int(match[1]) if match[1] else 1
+        o_count = int(match[2]) if match[2] else 1
+        return ti_count > 0 and o_count == 2 * ti_count
     
-    # Check if it's only Ti and O (no other elements)
-    if set(elements.keys()) != {'Ti', 'O'}:
+    # Formulas without both symbols can't be TiO2, skip parsing them
+    if 'Ti' not in bulk_symbols or 'O' not in bulk_symbols:
         return False
     
-    # Check Ti:O ratio = 1:2
-    ti_count = elements.get('Ti', 0)
-    o_count = elements.get('O', 0)
+    elements = parse_formula(bulk_symbols)
     
-    if ti_count == 0 or o_count == 0:
+    # Check if it's only Ti and O (no other elements)
+    if len(elements) != 2 or 'Ti' not in elements or 'O' not in elements:
         return False
     
-    # Reduce the ratio
-    ratio = Fraction(ti_count, o_count)
+    # Check Ti:O ratio = 1:2
+    ti_count = elements['Ti']
+    o_count = elements['O']
     
-    # TiO2 should have Ti:O = 1:2
-    return ratio == Fraction(1, 2)
+    # TiO2 should have Ti:O = 1:2, compared in integers instead of
+    # reducing a Fraction
+    return ti_count > 0 and o_count == 2 * ti_count
 
 
 def load_metadata():
@@ -68,13 +88,45 @@ def load_metadata():
         return None
     
     print(f"\nLoading metadata from: {DataPath.OC22_MAPPING_FILE}")
-    with open(DataPath.OC22_MAPPING_FILE, 'rb') as f:
-        data = pickle.load(f)
+    data = load_pickle(DataPath.OC22_MAPPING_FILE)
+    
+    # Many systems share a bulk and adsorbate, interning keeps one copy of
+    # each symbol string and lets the memo and Counter lookups compare by
+    # identity
+    intern = sys.intern
+    for info in data.values():
+        for key in ('bulk_symbols', 'ads_symbols'):
+            value = info.get(key)
+            if type(value) is str:
+                info[key] = intern(value)
     
     print(f"Loaded {len(data):,} total systems")
     return data
 
 
+def write_json_mapping(path, metadata):
+    """
+    Write a metadata mapping as indented JSON keyed by string system ID
+    
+    Systems are encoded JSON_CHUNK_SIZE at a time and the entries of each
+    chunk's object are spliced into one document, so neither a re-keyed
+    copy of the mapping nor the whole encoded document is held in memory.
+    Both json and orjson already write tuples as arrays, so the info dicts
+    are encoded as they are.
+    """
+    items = iter(metadata.items())
+    separator = b"\n"
+    with open(path, 'wb', buffering=JSON_BUFFER_SIZE) as f:
+        f.write(b"{")
+        while chunk := list(islice(items, JSON_CHUNK_SIZE)):
+            encoded = encode_json({str(system_id): info for system_id, info in chunk})
+            # Drop the chunk's own opening "{\n" and closing "\n}"
+            f.write(separator)
+            f.write(encoded[2:-2])
+            separator = b",\n"
+        f.write(b"\n}" if metadata else b"}")
+
+
 def save_full_data_mapping(metadata):
     """
     Save full metadata as JSON for easy inspection
@@ -85,24 +137,12 @@ def save_full_data_mapping(metadata):
     # Ensure metadata directory exists
     DataPath.METADATA_DIR.mkdir(parents=True, exist_ok=True)
     
-    # Convert to JSON-compatible format
-    json_data = {}
-    for system_id, info in tqdm(metadata.items(), desc="Converting to JSON"):
-        json_data[str(system_id)] = {}
-        for key, value in info.items():
-            # Convert tuples to lists for JSON compatibility
-            if isinstance(value, tuple):
-                json_data[str(system_id)][key] = list(value)
-            else:
-                json_data[str(system_id)][key] = value
-    
     # Save full mapping
     full_mapping_file = DataPath.METADATA_DIR / "full_data_mapping.json"
-    with open(full_mapping_file, 'w') as f:
-        json.dump(json_data, f, indent=2)
+    write_json_mapping(full_mapping_file, metadata)
     
     print(f"Saved full data mapping to: {full_mapping_file}")
-    print(f"Total systems: {len(json_data):,}")
+    print(f"Total systems: {len(metadata):,}")
     
     return full_mapping_file
 
@@ -115,38 +155,38 @@ def filter_tio2_systems(metadata):
     tio2_slab_only = {}
     tio2_adslab = {}
     
-    for system_id, info in tqdm(metadata.items(), desc="Filtering"):
-        bulk_symbols = info.get('bulk_symbols', '')
-        
-        # Check if it's TiO2 with correct stoichiometry
-        if is_tio2(bulk_symbols):
-            tio2_metadata[system_id] = info
-            
-            if 'ads_symbols' in info and info.get('nads', 0) > 0:
-                tio2_adslab[system_id] = info
-            else:
-                tio2_slab_only[system_id] = info
-    
-    return tio2_metadata, tio2_slab_only, tio2_adslab
-
-
-def analyze_tio2_systems(tio2_metadata, tio2_slab_only, tio2_adslab):
-    """Analyze filtered TiO2 systems"""
-    
-    # Collect statistics
+    # Statistics are counted in the same pass, so the TiO2 systems are
+    # never walked again for analysis
     adsorbates = Counter()
     bulks = Counter()
     miller_indices = Counter()
     
-    for info in tio2_metadata.values():
-        ads = info.get('ads_symbols', 'N/A')
-        bulk = info.get('bulk_symbols', 'N/A')
-        miller = str(info.get('miller_index', (0, 0, 0)))
-        
-        if ads != 'N/A':
-            adsorbates[ads] += 1
-        bulks[bulk] += 1
-        miller_indices[miller] += 1
+    for chunk in iter_chunks(metadata.items(), len(metadata), "Filtering"):
+        for system_id, info in chunk:
+            bulk_symbols = info.get('bulk_symbols', '')
+            
+            # Check if it's TiO2 with correct stoichiometry
+            if is_tio2(bulk_symbols):
+                tio2_metadata[system_id] = info
+                
+                ads = info.get('ads_symbols', 'N/A')
+                if ads != 'N/A':
+                    adsorbates[ads] += 1
+                bulks[bulk_symbols] += 1
+                miller_indices[str(info.get('miller_index', (0, 0, 0)))] += 1
+                
+                if 'ads_symbols' in info and info.get('nads', 0) > 0:
+                    tio2_adslab[system_id] = info
+                else:
+                    tio2_slab_only[system_id] = info
+    
+    counts = (adsorbates, bulks, miller_indices)
+    return tio2_metadata, tio2_slab_only, tio2_adslab, counts
+
+
+def analyze_tio2_systems(tio2_metadata, tio2_slab_only, tio2_adslab, counts):
+    """Analyze filtered TiO2 systems from the counts collected while filtering"""
+    adsorbates, bulks, miller_indices = counts
     
     # Prepare statistics
     stats = {
@@ -164,24 +204,20 @@ def analyze_tio2_systems(tio2_metadata, tio2_slab_only, tio2_adslab):
     return stats
 
 
-def save_tio2_results(tio2_metadata, stats):
+def save_tio2_results(tio2_metadata, stats, also_pickle=False):
     """Save filtered TiO2 data and statistics"""
     DataPath.METADATA_DIR.mkdir(parents=True, exist_ok=True)
     
-    json_data = {}
-    for system_id, info in tqdm(tio2_metadata.items(), desc="Converting TiO2 to JSON"):
-        json_data[str(system_id)] = {}
-        for key, value in info.items():
-            if isinstance(value, tuple):
-                json_data[str(system_id)][key] = list(value)
-            else:
-                json_data[str(system_id)][key] = value
-    
     # Save TiO2 filtered mapping as JSON
-    with open(DataPath.TIO2_MAPPING_FILE, 'w') as f:
-        json.dump(json_data, f, indent=2)
+    write_json_mapping(DataPath.TIO2_MAPPING_FILE, tio2_metadata)
     print(f"\nSaved TiO2 mapping to: {DataPath.TIO2_MAPPING_FILE}")
     
+    # Optional pickle copy, loads much faster than the JSON downstream
+    if also_pickle:
+        with open(DataPath.TIO2_MAPPING_PKL_FILE, 'wb') as f:
+            pickle.dump(tio2_metadata, f, protocol=pickle.HIGHEST_PROTOCOL)
+        print(f"Saved TiO2 mapping to: {DataPath.TIO2_MAPPING_PKL_FILE}")
+    
     # Save system IDs
     with open(DataPath.TIO2_SYSTEM_IDS_FILE, 'w') as f:
         for sid in sorted(tio2_metadata.keys()):
@@ -189,12 +225,19 @@ def save_tio2_results(tio2_metadata, stats):
     print(f"Saved {len(tio2_metadata):,} system IDs to: {DataPath.TIO2_SYSTEM_IDS_FILE}")
     
     # Save statistics as JSON
-    with open(DataPath.TIO2_STATISTICS_FILE, 'w') as f:
-        json.dump(stats, f, indent=2)
+    write_json(DataPath.TIO2_STATISTICS_FILE, stats)
     print(f"Saved statistics to: {DataPath.TIO2_STATISTICS_FILE}")
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--also-pickle",
+        action="store_true",
+        help="also save the TiO2 mapping as a pickle next to the JSON",
+    )
+    args = parser.parse_args()
+    
     print("\n" + "=" * 60)
     print("STEP 2: TiO2 System Filtering (OC22)")
     
@@ -204,11 +247,11 @@ if __name__ == "__main__":
     
     full_mapping_file = save_full_data_mapping(metadata)
     
-    tio2_metadata, tio2_slab_only, tio2_adslab = filter_tio2_systems(metadata)
+    tio2_metadata, tio2_slab_only, tio2_adslab, counts = filter_tio2_systems(metadata)
     
-    stats = analyze_tio2_systems(tio2_metadata, tio2_slab_only, tio2_adslab)
+    stats = analyze_tio2_systems(tio2_metadata, tio2_slab_only, tio2_adslab, counts)
     
-    save_tio2_results(tio2_metadata, stats)
+    save_tio2_results(tio2_metadata, stats, also_pickle=args.also_pickle)
 
     print("\nFinished TiO2 System Filtering")
     print(f"{'=' * 60}")
\ No newline at end of file
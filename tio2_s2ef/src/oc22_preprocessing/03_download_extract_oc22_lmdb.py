@@ -6,37 +6,15 @@ Downloads and extracts ready-to-use LMDB datasets
 import os
 import sys
 import tarfile
-import urllib.request
 from pathlib import Path
 from tqdm import tqdm
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+from download_utils import download_file
 from oc22_preprocessing.oc22_path_config import DataPath, DownloadURLs
 
 
-class DownloadProgressBar(tqdm):
-    """Progress bar for downloads"""
-    def update_to(self, b=1, bsize=1, tsize=None):
-        if tsize is not None:
-            self.total = tsize
-        self.update(b * bsize - self.n)
-
-
-def download_file(url, output_path):
-    """Download file with progress bar"""
-    print(f"Downloading from: {url}")
-    print(f"Saving to: {output_path}")
-    
-    output_path.parent.mkdir(parents=True, exist_ok=True)
-    
-    with DownloadProgressBar(unit='B', unit_scale=True, miniters=1, desc="Downloading") as t:
-        urllib.request.urlretrieve(url, output_path, reporthook=t.update_to)
-    
-    size_gb = output_path.stat().st_size / (1024**3)
-    print(f"Downloaded: {size_gb:.2f} GB")
-
-
 def extract_tar_gz(tar_path, extract_to):
     """Extract .tar.gz file with progress bar"""
     print(f"\nExtracting: {tar_path.name}")
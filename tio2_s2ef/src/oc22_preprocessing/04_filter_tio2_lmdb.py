@@ -2,17 +2,55 @@
 Step 4: Filter TiO2 systems from OC22 pre-computed LMDBs
 """
 
+import io
+import multiprocessing as mp
 import pickle
+import pickletools
+import re
 import sys
 from pathlib import Path
 
 import lmdb
-from tqdm import tqdm
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from oc22_preprocessing.oc22_path_config import DataPath, OC22DataPath
 
+# Attribute names that hold the system ID of a data object
+SID_KEYS = {'sid', 'system_id'}
+
+# Opcodes that push a plain int or str literal onto the pickle stack
+LITERAL_OPCODES = {
+    'INT', 'BININT', 'BININT1', 'BININT2', 'LONG', 'LONG1', 'LONG4',
+    'UNICODE', 'SHORT_BINUNICODE', 'BINUNICODE', 'BINUNICODE8',
+}
+
+# Opcodes that only store into the unpickler memo
+MEMO_OPCODES = {'PUT', 'BINPUT', 'LONG_BINPUT', 'MEMOIZE'}
+
+# Opcodes that store the value just pushed into a dict
+SETITEM_OPCODES = {'SETITEM', 'SETITEMS'}
+
+# Opcodes that consume the literals before them to build another object, so
+# those literals were a module/class name or constructor arguments
+CONSTRUCTOR_OPCODES = {'STACK_GLOBAL', 'GLOBAL', 'REDUCE', 'NEWOBJ', 'NEWOBJ_EX'}
+
+# The same opcodes as raw bytes, for checks done without pickletools
+CONSTRUCTOR_BYTES = b'\x93cR\x81\x92'
+
+# The 'sid' key as pickle protocol 4+ writes it (SHORT_BINUNICODE), plus an
+# optional MEMOIZE. A compiled bytes pattern can search memoryviews in place.
+SID_TAG = re.compile(rb'\x8c\x03sid\x94?')
+
+# Number of records written per output LMDB transaction
+COMMIT_INTERVAL = 100_000
+
+# Maximum number of LMDB files filtered in parallel
+MAX_WORKERS = 8
+
+# Number of records scanned between progress updates
+PROGRESS_INTERVAL = 1 << 16
+
 
 def load_tio2_system_ids():
     """Load TiO2 system IDs from filtered metadata"""
@@ -28,10 +66,133 @@ def load_tio2_system_ids():
             line = line.strip()
             if not line:
                 continue
-            system_ids.add(line)
+            system_ids.add(parse_system_id(line))
     
     print(f"Loaded {len(system_ids):,} TiO2 system IDs")
-    return system_ids
+    return frozenset(system_ids)
+
+
+def parse_system_id(sid):
+    """Normalize a system ID so numeric IDs are compared as ints"""
+    # Only strings that an int prints back to exactly are converted, so
+    # '-5' still matches -5 and '007' stays distinct from 7
+    if isinstance(sid, str) and sid.removeprefix('-').isdecimal() and str(int(sid)) == sid:
+        return int(sid)
+    return sid
+
+
+def peek_sid(value):
+    """
+    Read the system ID that directly follows the pickled 'sid' key
+    
+    Only handles the common layout where the ID is a small int or a short
+    string pickled as the whole value, not as the start of an object.
+    Returns None for anything else so the caller can fall back.
+    """
+    match = SID_TAG.search(value)
+    if match is None:
+        return None
+    
+    i = match.end()
+    if i + 1 >= len(value):
+        return None
+    opcode = value[i]
+    if opcode == 0x4B:  # BININT1
+        sid, end = value[i + 1], i + 2
+    elif opcode == 0x4D:  # BININT2
+        sid, end = int.from_bytes(value[i + 1:i + 3], 'little'), i + 3
+    elif opcode == 0x4A:  # BININT
+        sid, end = int.from_bytes(value[i + 1:i + 5], 'little', signed=True), i + 5
+    elif opcode == 0x8A:  # LONG1
+        end = i + 2 + value[i + 1]
+        sid = int.from_bytes(value[i + 2:end], 'little', signed=True)
+    elif opcode == 0x8C:  # SHORT_BINUNICODE
+        end = i + 2 + value[i + 1]
+        sid = bytes(value[i + 2:end]).decode('utf-8')
+    else:
+        return None
+    
+    if not ends_dict_value(value, end):
+        return None
+    return sid
+
+
+def ends_dict_value(value, i):
+    """
+    Check that the literal ending at offset i is a complete dict value
+    
+    Same rule as scan_sid: the dict must store it next (SETITEM/SETITEMS) or
+    move on to another key that no constructor opcode consumes. Otherwise
+    the literal is, for example, the module name of a pickled NumPy scalar.
+    """
+    n = len(value)
+    if i < n and value[i] == 0x94:  # MEMOIZE
+        i += 1
+    if i + 1 >= n:
+        return False
+    opcode = value[i]
+    if opcode == 0x75 or opcode == 0x73:  # SETITEMS, SETITEM
+        return True
+    if opcode != 0x8C:  # SHORT_BINUNICODE
+        return False
+    i += 2 + value[i + 1]
+    if i < n and value[i] == 0x94:
+        i += 1
+    return i < n and value[i] not in CONSTRUCTOR_BYTES
+
+
+def scan_sid(value):
+    """
+    Read the system ID from a pickled data object without unpickling it
+    
+    Walks the pickle opcodes up to the first 'sid'/'system_id' key and returns
+    the literal stored right after it, so none of the tensors are rebuilt.
+    Returns None if no such key is found or its value is not a plain literal.
+    """
+    ops = (
+        (opcode.name, arg)
+        for opcode, arg, _ in pickletools.genops(io.BytesIO(value))
+        if opcode.name not in MEMO_OPCODES
+    )
+    for name, arg in ops:
+        if name in LITERAL_OPCODES and arg in SID_KEYS:
+            name, sid = next(ops, (None, None))
+            if name not in LITERAL_OPCODES:
+                return None
+            
+            # The literal is the whole value only if the dict stores it next
+            # or moves on to another key. A literal that a global or
+            # constructor consumes is part of an object, e.g. the module
+            # name of a NumPy scalar.
+            name, _ = next(ops, (None, None))
+            if name in SETITEM_OPCODES:
+                return sid
+            if name in LITERAL_OPCODES:
+                name, _ = next(ops, (None, None))
+                if name not in CONSTRUCTOR_OPCODES:
+                    return sid
+            return None
+    return None
+
+
+def read_sid(value):
+    """Get the normalized system ID of an LMDB record, or None"""
+    sid = peek_sid(value)
+    if sid is None:
+        sid = scan_sid(value)
+    if sid is not None:
+        return parse_system_id(sid)
+    
+    # Fall back to full deserialization for non-literal IDs, compared by
+    # their string form like the IDs in the system ID file
+    data = pickle.loads(value)
+    if hasattr(data, 'sid'):
+        return parse_system_id(str(data.sid))
+    elif hasattr(data, 'system_id'):
+        return parse_system_id(str(data.system_id))
+    elif hasattr(data, 'metadata') and 'system_id' in data.metadata:
+        return parse_system_id(str(data.metadata['system_id']))
+    return None
 
 
 def filter_lmdb_by_system_ids(input_lmdb_path, output_lmdb_path, tio2_ids, split_name):
@@ -39,80 +200,101 @@ def filter_lmdb_by_system_ids(input_lmdb_path, output_lmdb_path, tio2_ids, split
     Filter an LMDB database to keep only TiO2 systems
     """
     
-    print(f"\nFiltering: {split_name}")
-    print(f"  Input:  {input_lmdb_path}")
-    print(f"  Output: {output_lmdb_path}")
+    # One print per message keeps lines intact when workers run in parallel
+    print(
+        f"\nFiltering: {split_name}\n"
+        f"  Input:  {input_lmdb_path}\n"
+        f"  Output: {output_lmdb_path}"
+    )
     
     env_src = lmdb.open(
         str(input_lmdb_path),
         subdir=False,
         readonly=True,
         lock=False,
-        readahead=False,
+        readahead=True,
         meminit=False,
     )
     
     # Create output LMDB
     output_lmdb_path.parent.mkdir(parents=True, exist_ok=True)
+    # Durability only matters once the whole file is written, so per-commit
+    # fsyncs are skipped and the env is flushed once at the end
     env_dst = lmdb.open(
         str(output_lmdb_path),
-        map_size=1024 * 1024 * 1024 * 0.5,  # 500 MB
+        map_size=1024 * 1024 * 512,  # 512 MB
         subdir=False,
         meminit=False,
         map_async=True,
+        sync=False,
+        metasync=False,
     )
     
     new_idx = 0
     
-    # Get total count for progress bar
+    # Get total count for progress reports
     with env_src.begin() as txn:
         total_count = txn.stat()['entries']
     
-    with env_src.begin() as txn_src:
+    # With buffers=True keys and values are memoryviews into the LMDB map,
+    # only valid until the cursor moves, so nothing is copied unless kept
+    txn_dst = env_dst.begin(write=True)
+    with env_src.begin(buffers=True) as txn_src:
         cursor = txn_src.cursor()
         
-        for key, value in tqdm(cursor, total=total_count, desc=f"  Processing"):
+        for i, (key, value) in enumerate(cursor, 1):
+            if not i % PROGRESS_INTERVAL:
+                print(f"  {split_name}: {i:,}/{total_count:,} records scanned")
+            
             if key == b'length':
                 continue
             
             try:
-                data = pickle.loads(value)
-                
                 # Get system ID
-                sid = None
-                if hasattr(data, 'sid'):
-                    sid = str(data.sid)
-                elif hasattr(data, 'system_id'):
-                    sid = str(data.system_id)
-                elif hasattr(data, 'metadata') and 'system_id' in data.metadata:
-                    sid = str(data.metadata['system_id'])
-                
-                if sid is None:
-                    continue
-                
-                # Check if this system is TiO2
-                if sid in tio2_ids:
-                    txn_dst = env_dst.begin(write=True)
-                    txn_dst.put(
-                        f"{new_idx}".encode('ascii'),
-                        value
-                    )
-                    txn_dst.commit()
-                    new_idx += 1
-                    
+                sid = read_sid(value)
             except Exception as e:
                 continue
+            
+            # Check if this system is TiO2
+            if sid is None or sid not in tio2_ids:
+                continue
+            
+            txn_dst.put(f"{new_idx}".encode('ascii'), value)
+            new_idx += 1
+            
+            # Commit in batches to bound the number of dirty pages
+            if new_idx % COMMIT_INTERVAL == 0:
+                txn_dst.commit()
+                txn_dst = env_dst.begin(write=True)
     
     # Save count in destination LMDB
-    txn_dst = env_dst.begin(write=True)
     txn_dst.put(b'length', pickle.dumps(new_idx, protocol=-1))
     txn_dst.commit()
     
-    env_dst.sync()
+    env_dst.sync(True)
     env_dst.close()
     env_src.close()
     
-    print(f"  TiO2 entries saved: {new_idx:,}")
+    print(f"  {split_name}: TiO2 entries saved: {new_idx:,}")
+    return new_idx
+
+
+def init_worker(tio2_ids):
+    """Hand the TiO2 system IDs to a pool worker once, at startup"""
+    global worker_tio2_ids
+    worker_tio2_ids = tio2_ids
+
+
+def filter_lmdb_job(job):
+    """Filter one (input path, output path, name) job inside a pool worker"""
+    input_lmdb_path, output_lmdb_path, split_name = job
+    return filter_lmdb_by_system_ids(
+        input_lmdb_path,
+        output_lmdb_path,
+        worker_tio2_ids,
+        split_name
+    )
+
 
 def main():
     print("=" * 60)
@@ -129,7 +311,8 @@ def main():
     print(f"\nSplits to process: {', '.join(splits)}")
     print(f"TiO2 system IDs to filter: {len(tio2_ids):,}")
     
-    # Process each split
+    # Collect the LMDB files of each split
+    jobs = []
     for split in splits:
         input_dir = OC22DataPath.get_split_dir(split)
         output_dir = OC22DataPath.get_tio2_split_dir(split)
@@ -141,21 +324,33 @@ def main():
             print("Run 03_download_oc22_lmdb.py first")
             continue
         
-        print(f"Found {len(lmdb_files)} LMDB file(s)")
+        print(f"Found {len(lmdb_files)} LMDB file(s) in {split}")
         
-        # Process each LMDB file
         for lmdb_file in lmdb_files:
-            output_file = output_dir / lmdb_file.name
-            
-            filter_lmdb_by_system_ids(
-                lmdb_file,
-                output_file,
-                tio2_ids,
-                lmdb_file.name
-            )
+            jobs.append((lmdb_file, output_dir / lmdb_file.name, f"{split}/{lmdb_file.name}"))
+    
+    if not jobs:
+        return
+    
+    # Start the largest files first so a big file picked up last does not
+    # leave the other workers idle at the end
+    sizes = {job[0]: job[0].stat().st_size for job in jobs}
+    jobs.sort(key=lambda job: sizes[job[0]], reverse=True)
+    
+    # Every LMDB file is independent, so filter them in parallel
+    num_workers = min(MAX_WORKERS, len(jobs))
+    print(
+        f"\nFiltering {len(jobs)} LMDB file(s), "
+        f"{sum(sizes.values()) / (1024**3):.2f} GB total, "
+        f"largest {max(sizes.values()) / (1024**3):.2f} GB, "
+        f"with {num_workers} workers"
+    )
+    with mp.Pool(num_workers, initializer=init_worker, initargs=(tio2_ids,)) as pool:
+        saved_counts = list(pool.imap_unordered(filter_lmdb_job, jobs, chunksize=1))
     
     # Final summary
-    print(f"\nFiltered LMDBs saved to: {DataPath.TIO2_DIR}")
+    print(f"\nTotal TiO2 entries saved: {sum(saved_counts):,}")
+    print(f"Filtered LMDBs saved to: {DataPath.TIO2_DIR}")
     print("\nFiltering Complete!")
     print("=" * 60)
 
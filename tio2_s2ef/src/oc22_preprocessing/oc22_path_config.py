@@ -1,17 +1,4 @@
-from pathlib import Path
-
-
-class BasePath:
-    """Base directory paths"""
-    # Project root (where README.md, environment.yml)
-    PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
-    
-    # Main directories
-    SCRIPTS_DIR = PROJECT_ROOT / "scripts"
-    CONFIGS_DIR = PROJECT_ROOT / "configs"
-    NOTEBOOKS_DIR = PROJECT_ROOT / "notebooks"
-    TESTS_DIR = PROJECT_ROOT / "tests"
-    DOCS_DIR = PROJECT_ROOT / "docs"
+from path_config import BasePath, OutputPath
 
 
 class DataPath:
@@ -44,25 +31,31 @@ class DataPath:
     OC22_MAPPING_FILE = METADATA_DIR / "oc22_metadata.pkl"
     FULL_DATA_MAPPING_FILE = METADATA_DIR / "full_data_mapping.json"
     TIO2_MAPPING_FILE = METADATA_DIR / "tio2_data_mapping.json"
+    TIO2_MAPPING_PKL_FILE = METADATA_DIR / "tio2_data_mapping.pkl"
     TIO2_SYSTEM_IDS_FILE = METADATA_DIR / "tio2_system_ids.txt"
     TIO2_STATISTICS_FILE = METADATA_DIR / "tio2_statistics.json"
     TIO2_NORMALIZATION_FILE = METADATA_DIR / "tio2_normalization_stats.json"
 
 
-class OutputPath:
-    """Output paths for models, results, logs"""
-    # Model checkpoints
-    MODELS_DIR = BasePath.PROJECT_ROOT / "models"
-    CHECKPOINTS_DIR = BasePath.PROJECT_ROOT / "checkpoints"
-    
-    # Results and logs
-    RESULTS_DIR = BasePath.PROJECT_ROOT / "results"
-    LOGS_DIR = BasePath.PROJECT_ROOT / "logs"
-
-
 class OC22DataPath:
     """OC22 dataset specific paths"""
     
+    # Split lookup tables, built once at import
+    SPLIT_DIRS = {
+        "train": DataPath.TRAIN_DIR,
+        "val_id": DataPath.VAL_ID_DIR,
+        "val_ood": DataPath.VAL_OOD_DIR,
+        "test_id": DataPath.TEST_ID_DIR,
+        "test_ood": DataPath.TEST_OOD_DIR,
+    }
+    TIO2_SPLIT_DIRS = {
+        "train": DataPath.TIO2_TRAIN_DIR,
+        "val_id": DataPath.TIO2_VAL_ID_DIR,
+        "val_ood": DataPath.TIO2_VAL_OOD_DIR,
+        "test_id": DataPath.TIO2_TEST_ID_DIR,
+        "test_ood": DataPath.TIO2_TEST_OOD_DIR,
+    }
+    
     @staticmethod
     def get_s2ef_total_dir():
         """Get S2EF-Total base directory"""
@@ -73,28 +66,14 @@ class OC22DataPath:
         """
         Get directory for specific split
         """
-        split_dirs = {
-            "train": DataPath.TRAIN_DIR,
-            "val_id": DataPath.VAL_ID_DIR,
-            "val_ood": DataPath.VAL_OOD_DIR,
-            "test_id": DataPath.TEST_ID_DIR,
-            "test_ood": DataPath.TEST_OOD_DIR,
-        }
-        return split_dirs.get(split, DataPath.TRAIN_DIR)
+        return OC22DataPath.SPLIT_DIRS.get(split, DataPath.TRAIN_DIR)
     
     @staticmethod
     def get_tio2_split_dir(split="train"):
         """
         Get TiO2 filtered directory for specific split
         """
-        split_dirs = {
-            "train": DataPath.TIO2_TRAIN_DIR,
-            "val_id": DataPath.TIO2_VAL_ID_DIR,
-            "val_ood": DataPath.TIO2_VAL_OOD_DIR,
-            "test_id": DataPath.TIO2_TEST_ID_DIR,
-            "test_ood": DataPath.TIO2_TEST_OOD_DIR,
-        }
-        return split_dirs.get(split, DataPath.TIO2_TRAIN_DIR)
+        return OC22DataPath.TIO2_SPLIT_DIRS.get(split, DataPath.TIO2_TRAIN_DIR)
     
     @staticmethod
     def get_all_splits():
@@ -0,0 +1,25 @@
+from pathlib import Path
+
+
+class BasePath:
+    """Base directory paths"""
+    # Project root (where README.md, environment.yml)
+    PROJECT_ROOT = Path(__file__).resolve().parent.parent
+    
+    # Main directories
+    SCRIPTS_DIR = PROJECT_ROOT / "scripts"
+    CONFIGS_DIR = PROJECT_ROOT / "configs"
+    NOTEBOOKS_DIR = PROJECT_ROOT / "notebooks"
+    TESTS_DIR = PROJECT_ROOT / "tests"
+    DOCS_DIR = PROJECT_ROOT / "docs"
+
+
+class OutputPath:
+    """Output paths for models, results, logs"""
+    # Model checkpoints
+    MODELS_DIR = BasePath.PROJECT_ROOT / "models"
+    CHECKPOINTS_DIR = BasePath.PROJECT_ROOT / "checkpoints"
+    
+    # Results and logs
+    RESULTS_DIR = BasePath.PROJECT_ROOT / "results"
+    LOGS_DIR = BasePath.PROJECT_ROOT / "logs"
\ No newline at end of file